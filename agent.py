@@ -3,25 +3,63 @@
 
 import os
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
 from openai import OpenAI
+import pymongo
 import agent_tools as tools
+import metrics
+from mongo_conn import data_version
+from result_cache import make_key, normalize_question, open_response_cache
+from tool_encoding import encode_result, encode_results, share
 
 # Load env vars (OPENAI_API_KEY, etc.)
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = None
+
+def openai_client() -> OpenAI:
+    """Shared OpenAI client, created on first use."""
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+# Tool calls from one assistant turn run concurrently on a bounded pool,
+# each with its own deadline (seconds, counted from when the call starts running).
+TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "20"))
+TOOL_QUEUE_TIMEOUT = float(os.getenv("AGENT_TOOL_QUEUE_TIMEOUT", "60"))  # longest wait for a free worker
+TOOL_TIMEOUTS = {
+    "predict_next_points": 120.0,  # may train the model on first use after a refresh
+    "optimize_squad": 120.0,
+}
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="agent-tool")
+
+# Tool results and final answers are cached per data version (AGENT_CACHE*, see
+# result_cache.py). Refresh tools have side effects and are never cached.
+response_cache = open_response_cache()
+UNCACHED_TOOLS = {"refresh_data", "refresh_status"}
 
 SYSTEM = """You are a football FPL data agent.
 You can call tools to fetch data from a MongoDB-backed FPL dataset.
 Be concise and format answers as short bullet points or compact table-like text.
 
 Tools available:
-- refresh_data(max_players=150): refresh FPL data into MongoDB.
+- refresh_data(max_players=None, full=False): start a background refresh of FPL data into MongoDB; returns a job id.
+- refresh_status(job_id=None): progress of the current or most recent refresh.
 - top_xgi(min_minutes=300, position=None, limit=10): top players by xGI/90.
 - value_picks(min_minutes=300, position=None, limit=10): xGI/90 per £m.
 - recent_trend(player_name_substr, last_n=5): last GWs for a player.
+- price_trend(player_name, last_n_gws=5): price, ownership, form and status at the end of each of the last GWs.
 - captain_suggestion(min_minutes=300, limit=10): captain options based on availability × xGI/90.
+- predict_next_points(position=None, limit=10, max_price=None): model-predicted points for the next GW.
+- fixture_projection(horizon=5, position=None, limit=10, max_price=None, min_minutes=0): fixture-adjusted expected points over the next N GWs.
+- similar_players(name, max_price=None, limit=5, position=None): players with the closest attacking profile, minutes and price to a named player (e.g. "a cheaper Saka"); same position unless position is given ("ANY" for all).
+- optimize_squad(budget=100.0, current_squad=None, max_transfers=None): best 15-man squad (or transfers from current_squad) by predicted points, within budget, 2/5/5/3 positions and max 3 per club.
 
+Tool results come back as compact tables: a header line of column names, then one comma-separated line per row; "… N more rows" means the table was cut to fit.
 If no tool is needed, just answer directly. Otherwise, call the tool(s) and summarize results clearly.
 """
 
@@ -31,11 +69,25 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "refresh_data",
-            "description": "Refresh data from FPL API into MongoDB.",
+            "description": "Start a background refresh of FPL API data into MongoDB. Returns a job id immediately.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "max_players": {"type": "integer", "description": "Only load history for the top N players by minutes (default: all)."},
+                    "full": {"type": "boolean", "default": False, "description": "Re-fetch every player's history instead of only changed players."}
+                }
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "refresh_status",
+            "description": "Progress of a data refresh job (stage, players done/total, status).",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "max_players": {"type": "integer", "default": 150}
+                    "job_id": {"type": "string"}
                 }
             },
         },
@@ -74,7 +126,7 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "recent_trend",
-            "description": "Recent gameweek stats for a player by rough name match.",
+            "description": "Recent gameweek stats for a player, resolved by best name match (accents and case ignored).",
             "parameters": {
                 "type": "object",
                 "required": ["player_name_substr"],
@@ -85,6 +137,21 @@ TOOLS = [
             },
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "price_trend",
+            "description": "Price (£m), ownership %, form and availability trajectory for a player over the last N gameweeks.",
+            "parameters": {
+                "type": "object",
+                "required": ["player_name"],
+                "properties": {
+                    "player_name": {"type": "string"},
+                    "last_n_gws": {"type": "integer", "default": 5}
+                }
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
@@ -99,31 +166,303 @@ TOOLS = [
             },
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "fixture_projection",
+            "description": "Projected FPL points over the next N gameweeks, adjusted for fixture difficulty (doubles and blanks included).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "horizon": {"type": "integer", "default": 5, "description": "Gameweeks ahead (1-10)."},
+                    "position": {"type": "string", "enum": ["GK", "DEF", "MID", "FWD"]},
+                    "limit": {"type": "integer", "default": 10},
+                    "max_price": {"type": "number"},
+                    "min_minutes": {"type": "integer", "default": 0}
+                }
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "predict_next_points",
+            "description": "Model-predicted FPL points for the next gameweek, optionally by position and max price (£m).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "position": {"type": "string", "enum": ["GK", "DEF", "MID", "FWD"]},
+                    "limit": {"type": "integer", "default": 10},
+                    "max_price": {"type": "number"}
+                }
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "optimize_squad",
+            "description": "Best 15-player FPL squad by predicted next-GW points within budget (£m), 2 GK/5 DEF/5 MID/3 FWD and max 3 per club. With current_squad, suggests at most max_transfers transfers; budget is then squad value plus bank.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "budget": {"type": "number", "default": 100.0},
+                    "current_squad": {"type": "array", "items": {"type": "string"}, "description": "Player names or ids of the current 15."},
+                    "max_transfers": {"type": "integer"}
+                }
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "similar_players",
+            "description": "Players most similar to a named player by xG/xA/xGI per 90, recent form, minutes share and price (e.g. 'a cheaper Saka' -> max_price below his price).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "max_price": {"type": "number", "description": "Only players at or below this price (£m)."},
+                    "limit": {"type": "integer", "default": 5},
+                    "position": {"type": "string", "enum": ["GK", "DEF", "MID", "FWD", "ANY"], "description": "Defaults to the player's own position."}
+                },
+                "required": ["name"]
+            },
+        },
+    },
 ]
 
 def call_tool(name: str, args: dict):
     """Dispatch to local tool functions."""
     if name == "refresh_data":
         return tools.refresh_data(**args)
+    if name == "refresh_status":
+        return tools.refresh_status(**args)
     if name == "top_xgi":
         return tools.top_xgi(**args)
     if name == "value_picks":
         return tools.value_picks(**args)
     if name == "recent_trend":
         return tools.recent_trend(**args)
+    if name == "price_trend":
+        return tools.price_trend(**args)
     if name == "captain_suggestion":
         return tools.captain_suggestion(**args)
+    if name == "fixture_projection":
+        return tools.fixture_projection(**args)
+    if name == "predict_next_points":
+        return tools.predict_next_points(**args)
+    if name == "optimize_squad":
+        return tools.optimize_squad(**args)
+    if name == "similar_players":
+        return tools.similar_players(**args)
     return {"error": f"Unknown tool '{name}'"}
 
-def chat_once(user_text: str) -> str:
-    """One-shot chat turn with correct tool-calling protocol."""
+def _safe_call(name: str, args: dict):
+    try:
+        return call_tool(name, args)
+    except Exception as e:
+        return {"error": f"Tool '{name}' failed: {e!r}"}
+
+def _is_error(result) -> bool:
+    return isinstance(result, dict) and "error" in result or (
+        isinstance(result, list) and len(result) == 1 and isinstance(result[0], dict) and "error" in result[0])
+
+def _cached_call(name: str, args: dict):
+    if name in UNCACHED_TOOLS:
+        return _safe_call(name, args)
+    key = make_key(name, args, data_version())
+    result = response_cache.get(key)
+    metrics.inc("agent_cache_total", kind="tool", result="miss" if result is None else "hit")
+    if result is None:
+        result = _safe_call(name, args)
+        if not _is_error(result):
+            response_cache.set(key, result)
+    return result
+
+def run_tool_calls(tool_calls: list) -> list:
+    """
+    Runs all tool calls of one assistant turn concurrently and returns their
+    results in the same order as `tool_calls`. A call that exceeds its timeout
+    yields an error result instead of holding up the others.
+    """
+    return list(iter_tool_calls(tool_calls))
+
+def _run_tool(name: str, args: dict, timeout: float, state: dict):
+    """
+    Worker side of a tool call. Its Mongo operations share the call's timeout
+    (pymongo client-side timeout -> maxTimeMS and socket timeouts), so a hung
+    query fails instead of holding the worker forever.
+    """
+    state["start"] = time.monotonic()
+    state["started"].set()
+    with pymongo.timeout(timeout):
+        return _cached_call(name, args)
+
+def iter_tool_calls(tool_calls: list):
+    """Like run_tool_calls, but yields each result (in order) as soon as it's ready."""
+    pending = []
+    for tc in tool_calls:
+        func_name = tc["function"]["name"]
+        try:
+            args = json.loads(tc["function"]["arguments"] or "{}")
+        except Exception:
+            args = {}
+        timeout = TOOL_TIMEOUTS.get(func_name, TOOL_TIMEOUT)
+        state = {"started": threading.Event()}
+        pending.append((func_name, timeout, time.monotonic() + TOOL_QUEUE_TIMEOUT, state,
+                        _tool_pool.submit(_run_tool, func_name, args, timeout, state)))
+
+    for func_name, timeout, queue_deadline, state, fut in pending:
+        # A call still queued behind busy workers can be cancelled; a running one can't
+        if not state["started"].wait(max(0.0, queue_deadline - time.monotonic())) and fut.cancel():
+            yield {"error": f"Tool '{func_name}' did not start within {TOOL_QUEUE_TIMEOUT:.0f}s (all workers busy)"}
+            continue
+        state["started"].wait()
+        try:
+            yield fut.result(timeout=max(0.0, state["start"] + timeout - time.monotonic()))
+        except FutureTimeout:
+            yield {"error": f"Tool '{func_name}' timed out after {timeout:.0f}s"}
+
+def _complete(client, call: str, **kwargs):
+    """chat.completions.create with latency and token-usage metrics."""
+    with metrics.timed("openai_call", call=call, model=kwargs.get("model")):
+        resp = client.chat.completions.create(**kwargs)
+    _record_usage(call, getattr(resp, "usage", None))
+    return resp
+
+def _record_usage(call: str, usage):
+    if usage is not None:
+        metrics.inc("openai_tokens_total", usage.prompt_tokens, kind="prompt", call=call)
+        metrics.inc("openai_tokens_total", usage.completion_tokens, kind="completion", call=call)
+        metrics.emit("openai_usage", call=call, prompt_tokens=usage.prompt_tokens,
+                     completion_tokens=usage.completion_tokens)
+
+def _stream(client, call: str, **kwargs):
+    """
+    Streaming chat.completions.create: yields answer text as it arrives and
+    returns (content, tool_calls) with the tool-call deltas reassembled.
+    """
+    content, calls = [], {}
+    start = time.perf_counter()
+    first = True
+    with metrics.timed("openai_call", call=call, model=kwargs.get("model"), stream=True):
+        for chunk in client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs):
+            _record_usage(call, getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            for tc in getattr(delta, "tool_calls", None) or []:
+                slot = calls.setdefault(tc.index, {"id": None, "type": "function",
+                                                   "function": {"name": "", "arguments": ""}})
+                slot["id"] = tc.id or slot["id"]
+                if tc.function is not None:
+                    slot["function"]["name"] += tc.function.name or ""
+                    slot["function"]["arguments"] += tc.function.arguments or ""
+            if delta.content:
+                if first:
+                    metrics.observe("openai_first_token_seconds", time.perf_counter() - start, call=call)
+                    first = False
+                content.append(delta.content)
+                yield delta.content
+    return "".join(content), [calls[i] for i in sorted(calls)]
+
+def chat_stream(user_text: str, client=None):
+    """
+    Streaming variant of chat_once. Yields event dicts as the turn progresses:
+      {"type": "tool_start", "name", "args"} once per requested tool call,
+      {"type": "tool_done", "name", "ok"} as each result arrives (in call order),
+      {"type": "token", "text"} for each piece of the answer,
+      {"type": "done", "cached"} at the end.
+    """
+    key = ("answer", normalize_question(user_text), data_version())
+    answer = response_cache.get(key)
+    metrics.inc("agent_cache_total", kind="answer", result="miss" if answer is None else "hit")
+    if answer is not None:
+        yield {"type": "token", "text": answer}
+        yield {"type": "done", "cached": True}
+        return
+    client = client or openai_client()
+    messages = [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": user_text},
+    ]
+    parts, cacheable = [], True
+    try:
+        with metrics.timed("chat_turn", stream=True):
+            # 1) Plan: text streams straight through when no tool is needed
+            plan = _stream(client, "plan", model="gpt-4o-mini", messages=memo(messages),
+                           tools=TOOLS, tool_choice="auto", temperature=0)
+            while True:
+                try:
+                    text = next(plan)
+                except StopIteration as stop:
+                    content, tool_calls = stop.value
+                    break
+                parts.append(text)
+                yield {"type": "token", "text": text}
+
+            if tool_calls:
+                messages.append({"role": "assistant", "content": content or "", "tool_calls": tool_calls})
+                for tc in tool_calls:
+                    yield {"type": "tool_start", "name": tc["function"]["name"],
+                           "args": tc["function"]["arguments"] or "{}"}
+                # 2) Tools run concurrently; report each as it completes
+                budget, teams = share(len(tool_calls)), tools.team_labels()
+                for tc, result in zip(tool_calls, iter_tool_calls(tool_calls)):
+                    ok = not _is_error(result)
+                    cacheable = cacheable and ok and tc["function"]["name"] not in UNCACHED_TOOLS
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tc["id"],
+                        "name": tc["function"]["name"],
+                        "content": encode_result(result, budget, teams),
+                    })
+                    yield {"type": "tool_done", "name": tc["function"]["name"], "ok": ok}
+                # 3) Stream the summary
+                parts = []
+                for text in _stream(client, "summarize", model="gpt-4o-mini",
+                                    messages=memo(messages), temperature=0):
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+    finally:
+        metrics.write_prometheus()
+    answer = "".join(parts)
+    if cacheable and answer:
+        response_cache.set(key, answer)
+    yield {"type": "done", "cached": False}
+
+def chat_once(user_text: str, client=None) -> str:
+    """
+    One-shot chat turn with correct tool-calling protocol. Answers are cached on
+    the normalized question and data version; `client` replaces the OpenAI
+    client (e.g. a local stand-in).
+    """
+    key = ("answer", normalize_question(user_text), data_version())
+    answer = response_cache.get(key)
+    metrics.inc("agent_cache_total", kind="answer", result="miss" if answer is None else "hit")
+    if answer is not None:
+        return answer
+    try:
+        with metrics.timed("chat_turn"):
+            answer, cacheable = _chat_once(user_text, client or openai_client())
+    finally:
+        metrics.write_prometheus()
+    if cacheable and answer:
+        response_cache.set(key, answer)
+    return answer
+
+def _chat_once(user_text: str, client) -> tuple:
+    """Returns (answer, cacheable); turns that refresh data or hit a tool error aren't cacheable."""
     messages = [
         {"role": "system", "content": SYSTEM},
         {"role": "user", "content": user_text},
     ]
 
     # 1) Let the model decide whether to call a tool
-    first = client.chat.completions.create(
+    first = _complete(
+        client,
+        "plan",
         model="gpt-4o-mini",
         messages=memo(messages),
         tools=TOOLS,
@@ -152,33 +491,32 @@ def chat_once(user_text: str) -> str:
             "tool_calls": tool_calls,
         })
 
-        # 3) Execute each tool and append ONE tool message with matching tool_call_id and name
-        for tc in tool_calls:
-            func_name = tc["function"]["name"]
-            args_json = tc["function"]["arguments"] or "{}"
-            try:
-                args = json.loads(args_json)
-            except Exception:
-                args = {}
-            result = call_tool(func_name, args)
-
+        # 3) Execute the tools concurrently and append ONE tool message per call,
+        #    in the original tool_call order, with matching tool_call_id and name
+        #    (results are sent as compact, token-budgeted tables, see tool_encoding.py)
+        cacheable = True
+        results = run_tool_calls(tool_calls)
+        for tc, result, content in zip(tool_calls, results, encode_results(results, teams=tools.team_labels())):
+            cacheable = cacheable and tc["function"]["name"] not in UNCACHED_TOOLS and not _is_error(result)
             messages.append({
                 "role": "tool",
                 "tool_call_id": tc["id"],
-                "name": func_name,                  # REQUIRED
-                "content": json.dumps(result),      # string content
+                "name": tc["function"]["name"],     # REQUIRED
+                "content": content,                 # string content
             })
 
         # 4) Ask model to summarize tool outputs
-        final = client.chat.completions.create(
+        final = _complete(
+            client,
+            "summarize",
             model="gpt-4o-mini",
             messages=memo(messages),
             temperature=0,
         )
-        return final.choices[0].message.content
+        return final.choices[0].message.content, cacheable
 
     # 5) No tools needed
-    return assistant_msg.content
+    return assistant_msg.content, True
 
 def memo(msgs):
     """(Optional) shallow copy helper to avoid accidental mutation."""
@@ -193,4 +531,9 @@ if __name__ == "__main__":
             break
         if not q or q.lower() in {"exit", "quit"}:
             break
-        print(chat_once(q))
+        for ev in chat_stream(q):
+            if ev["type"] == "tool_start":
+                print(f"[{ev['name']}]", flush=True)
+            elif ev["type"] == "token":
+                print(ev["text"], end="", flush=True)
+        print()
@@ -1,49 +1,76 @@
 # agent_tools.py
 # Utility functions (tools) that the AI agent and Streamlit app can call.
-import os, subprocess
+import os, threading
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from mongo_conn import get_db, data_version
+from snapshot_cache import SnapshotCache
+from name_index import NameIndex
+import refresh_jobs
+import metrics
+import snapshot_history
+from projections import ProjectionEngine
+from squad_optimizer import SquadOptimizer
 
 # Load environment variables (MONGO_URI, DB_NAME, etc.)
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME   = os.getenv("DB_NAME", "fpl")
 
-# Connect to MongoDB
+# Serve the leaderboard tools from an in-memory columnar copy of player_snapshots
+# (reloaded whenever the ETL bumps the data version). Set SNAPSHOT_CACHE=0 to
+# always query Mongo instead.
+USE_SNAPSHOT_CACHE = os.getenv("SNAPSHOT_CACHE", "1") == "1"
+snapshot_cache = SnapshotCache()
+
+# Shared, pooled MongoDB connection (see mongo_conn.py)
 def _db():
-    return MongoClient(MONGO_URI)[DB_NAME]
+    return get_db()
+
+_teams = {"version": None, "labels": None}
+
+def team_labels() -> Dict[int, str]:
+    """Club id -> short name (e.g. 1 -> 'ARS'), reloaded per data version."""
+    version = data_version()
+    if _teams["labels"] is None or _teams["version"] != version:
+        teams = _db().teams.find({}, {"_id": 0, "id": 1, "short_name": 1, "name": 1})
+        labels = {t["id"]: t.get("short_name") or t.get("name") for t in teams}
+        _teams.update(version=version, labels=labels)
+    return _teams["labels"]
 
-# 1) Refresh the FPL data by re-running your ETL script
-def refresh_data(max_players: int = 150) -> str:
+# 1) Refresh the FPL data in the background (see refresh_jobs.py)
+def refresh_data(max_players: Optional[int] = None, full: bool = False) -> Dict[str, Any]:
     """
-    Runs the ETL script to refresh the data from the FPL API.
+    Starts an in-process ETL refresh and returns its job status immediately.
+    max_players limits history to the top N by minutes (None = everyone);
+    full=True re-fetches every history instead of only changed players.
     """
-    env = os.environ.copy()
-    try:
-        # Run the script and capture the output
-        out = subprocess.check_output(
-            ["python", "etl_fpl_to_mongo.py"],
-            stderr=subprocess.STDOUT,
-            text=True,
-            env=env,
-            timeout=1800
-        )
-        return f"✅ Refresh completed.\n{out[-1200:]}"  # Return the last part of the output
-    except subprocess.CalledProcessError as e:
-        return f"❌ Refresh failed: {e.output}"
-    except Exception as e:
-        return f"❌ Refresh failed: {repr(e)}"
+    return refresh_jobs.start_refresh(max_players=max_players, full=full)
 
-# 2) Get top xGI/90 players
-def top_xgi(min_minutes: int = 300, position: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
-    pos_map = {"GK": 1, "DEF": 2, "MID": 3, "FWD": 4}
-    match = {"minutes": {"$gte": int(min_minutes)}}
-    if position and position.upper() in pos_map:
-        match["element_type"] = pos_map[position.upper()]
-    db = _db()
-    pipeline = [
-        {"$match": match},
+def refresh_status(job_id: Optional[str] = None) -> Dict[str, Any]:
+    """Progress of a refresh job (the running or most recent one by default)."""
+    return refresh_jobs.job_status(job_id)
+
+def cancel_refresh(job_id: Optional[str] = None) -> Dict[str, Any]:
+    return refresh_jobs.cancel_refresh(job_id)
+
+# Leaderboard pipelines. Each one matches, sorts on a stored field and limits
+# before projecting, so it can be answered from the compound indexes created
+# in etl_fpl_to_mongo.ensure_indexes (see check_query_plans.py).
+POS_MAP = {"GK": 1, "DEF": 2, "MID": 3, "FWD": 4}
+POS_NAMES = {v: k for k, v in POS_MAP.items()}
+
+def _leaderboard_match(min_minutes: int, position: Optional[str]) -> Dict[str, Any]:
+    # Players with no minutes have no per-90 numbers; leaving them out also lets
+    # the partial (minutes > 0) indexes serve every leaderboard query.
+    match = {"minutes": {"$gte": max(1, int(min_minutes))}}
+    if position and position.upper() in POS_MAP:
+        match["element_type"] = POS_MAP[position.upper()]
+    return match
+
+def _top_xgi_pipeline(min_minutes: int, position: Optional[str], limit: int) -> list:
+    return [
+        {"$match": _leaderboard_match(min_minutes, position)},
+        {"$sort": {"expected_goal_involvements_per_90": -1}},
+        {"$limit": int(limit)},
         {"$project": {
             "_id": 0,
             "id": 1,
@@ -56,30 +83,11 @@ def top_xgi(min_minutes: int = 300, position: Optional[str] = None, limit: int =
             "xa90": "$expected_assists_per_90",
             "price_m": {"$divide": ["$now_cost", 10]}
         }},
-        {"$sort": {"xgi90": -1}},
-        {"$limit": int(limit)}
     ]
-    return list(db.player_snapshots.aggregate(pipeline))
 
-# 3) Get top FPL value picks
-def value_picks(min_minutes: int = 300, position: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
-    pos_map = {"GK": 1, "DEF": 2, "MID": 3, "FWD": 4}
-    match = {"minutes": {"$gte": int(min_minutes)}}
-    if position and position.upper() in pos_map:
-        match["element_type"] = pos_map[position.upper()]
-    db = _db()
-    pipeline = [
-        {"$match": match},
-        {"$addFields": {"price_m": {"$divide": ["$now_cost", 10]}}},
-        {"$addFields": {
-            "xgi90_per_m": {
-                "$cond": [
-                    {"$gt": ["$price_m", 0]},
-                    {"$divide": ["$expected_goal_involvements_per_90", "$price_m"]},
-                    None
-                ]
-            }
-        }},
+def _value_picks_pipeline(min_minutes: int, position: Optional[str], limit: int) -> list:
+    return [
+        {"$match": _leaderboard_match(min_minutes, position)},
         {"$sort": {"xgi90_per_m": -1}},
         {"$limit": int(limit)},
         {"$project": {
@@ -88,28 +96,79 @@ def value_picks(min_minutes: int = 300, position: Optional[str] = None, limit: i
             "web_name": 1,
             "element_type": 1,
             "minutes": 1,
-            "price_m": 1,
+            "price_m": {"$divide": ["$now_cost", 10]},
             "xgi90_per_m": 1
-        }}
+        }},
     ]
-    return list(db.player_snapshots.aggregate(pipeline))
+
+def _captain_pipeline(min_minutes: int, limit: int) -> list:
+    return [
+        {"$match": _leaderboard_match(min_minutes, None)},
+        {"$sort": {"captain_score": -1}},
+        {"$limit": int(limit)},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "web_name": 1,
+            "element_type": 1,
+            "minutes": 1,
+            "xgi90": "$expected_goal_involvements_per_90",
+            "chance": "$chance_of_playing_next_round",
+            "status": 1,
+            "price_m": {"$divide": ["$now_cost", 10]},
+            "chanceF": "$captain_chance",
+            "score": "$captain_score"
+        }},
+    ]
+
+def _recent_history_pipeline(player_id: int, last_n: int) -> list:
+    return [
+        {"$match": {"player_id": player_id}},
+        {"$sort": {"round": -1}},
+        {"$limit": int(last_n)},
+    ]
+
+# 2) Get top xGI/90 players
+@metrics.timed_fn("tool")
+def top_xgi(min_minutes: int = 300, position: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    if USE_SNAPSHOT_CACHE:
+        match = _leaderboard_match(min_minutes, position)
+        return snapshot_cache.top_xgi(match["minutes"]["$gte"], match.get("element_type"), limit)
+    return list(_db().player_snapshots.aggregate(_top_xgi_pipeline(min_minutes, position, limit)))
+
+# 3) Get top FPL value picks
+@metrics.timed_fn("tool")
+def value_picks(min_minutes: int = 300, position: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    if USE_SNAPSHOT_CACHE:
+        match = _leaderboard_match(min_minutes, position)
+        return snapshot_cache.value_picks(match["minutes"]["$gte"], match.get("element_type"), limit)
+    return list(_db().player_snapshots.aggregate(_value_picks_pipeline(min_minutes, position, limit)))
+
+# Player-name index, rebuilt once per data version
+_names = {"version": None, "index": None}
+
+def _name_index() -> NameIndex:
+    version = data_version()
+    if _names["index"] is None or _names["version"] != version:
+        fields = ["id", "web_name", "first_name", "second_name", "search_name", "search_full", "minutes"]
+        players = _db().player_snapshots.find({}, {"_id": 0, **{f: 1 for f in fields}})
+        _names.update(version=version, index=NameIndex(players))
+    return _names["index"]
+
+def resolve_player(name: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """Best-ranked players for a free-text name (best match first)."""
+    return _name_index().search(name, limit=limit)
 
 # 4) Get recent GW trend for a specific player
+@metrics.timed_fn("tool")
 def recent_trend(player_name_substr: str, last_n: int = 5) -> Dict[str, Any]:
     db = _db()
-    p = db.player_snapshots.find_one(
-        {"web_name": {"$regex": player_name_substr, "$options": "i"}},
-        {"id": 1, "web_name": 1}
-    )
-    if not p:
+    matches = resolve_player(player_name_substr)
+    if not matches:
         return {"error": f"No player matches '{player_name_substr}'"}
+    p = matches[0]
     pid = p["id"]
-    rows = list(
-        db.player_history
-          .find({"player_id": pid})
-          .sort("round", -1)
-          .limit(int(last_n))
-    )
+    rows = list(db.player_history.aggregate(_recent_history_pipeline(pid, last_n)))
     rows = [
         {
             "round": r["round"],
@@ -121,35 +180,160 @@ def recent_trend(player_name_substr: str, last_n: int = 5) -> Dict[str, Any]:
         }
         for r in rows
     ]
-    return {"player_id": pid, "web_name": p["web_name"], "recent": rows}
+    out = {"player_id": pid, "web_name": p["web_name"], "recent": rows}
+    if len(matches) > 1:
+        out["other_matches"] = [m["web_name"] for m in matches[1:]]
+    return out
+
+# 4b) Price / ownership / form trajectory over the last N gameweeks
+@metrics.timed_fn("tool")
+def price_trend(player_name: str, last_n_gws: int = 5) -> Dict[str, Any]:
+    db = _db()
+    matches = resolve_player(player_name)
+    if not matches:
+        return {"error": f"No player matches '{player_name}'"}
+    p = matches[0]
+    ev = (db.events.find_one({"is_current": True}, {"id": 1})
+          or db.events.find_one({"finished": True}, {"id": 1}, sort=[("id", -1)]))
+    rows = snapshot_history.trajectory(db, p["id"], last_n_gws, ev["id"] if ev else 0)
+    for r in rows:
+        cost = r.pop("now_cost")
+        r["price_m"] = cost / 10 if cost is not None else None
+    return {"player_id": p["id"], "web_name": p["web_name"], "trajectory": rows}
 
 # 5) Suggest captain based on xGI/90 * chance of playing
+@metrics.timed_fn("tool")
 def captain_suggestion(min_minutes: int = 300, limit: int = 10) -> List[Dict[str, Any]]:
-    db = _db()
-    pipeline = [
-        {"$match": {"minutes": {"$gte": int(min_minutes)}}},
-        {"$project": {
-            "_id": 0,
-            "id": 1,
-            "web_name": 1,
-            "element_type": 1,
-            "minutes": 1,
-            "xgi90": "$expected_goal_involvements_per_90",
-            "chance": "$chance_of_playing_next_round",
-            "status": 1,
-            "price_m": {"$divide": ["$now_cost", 10]}
-        }},
-        {"$addFields": {
-            "chanceF": {
-                "$cond": [
-                    {"$gt": ["$chance", 0]},
-                    {"$divide": ["$chance", 100]},
-                    0.9
-                ]
-            }
-        }},
-        {"$addFields": {"score": {"$multiply": ["$xgi90", "$chanceF"]}}},
-        {"$sort": {"score": -1}},
-        {"$limit": int(limit)}
+    if USE_SNAPSHOT_CACHE:
+        return snapshot_cache.captain_suggestion(max(1, int(min_minutes)), limit)
+    return list(_db().player_snapshots.aggregate(_captain_pipeline(min_minutes, limit)))
+
+# 5b) Fixture-aware expected points over the next N gameweeks (see projections.py)
+_projection = {"version": None, "engine": None}
+
+def _projection_engine() -> ProjectionEngine:
+    version = data_version()
+    if _projection["engine"] is None or _projection["version"] != version:
+        _projection.update(version=version, engine=ProjectionEngine(_db()))
+    return _projection["engine"]
+
+@metrics.timed_fn("tool")
+def fixture_projection(horizon: int = 5, position: Optional[str] = None, limit: int = 10,
+                       max_price: Optional[float] = None, min_minutes: int = 0) -> List[Dict[str, Any]]:
+    element_type = POS_MAP.get(position.upper()) if position else None
+    return _projection_engine().top(snapshot_cache.columns(), horizon, element_type, limit, max_price, min_minutes)
+
+# 6) Predict next-GW points with the persisted model (see ml_predict_next_points.py)
+_predictions = {"version": None, "frame": None}
+_predictions_lock = threading.Lock()
+
+def _prediction_frame():
+    """Batch predictions for every player, computed once per data version."""
+    import ml_predict_next_points as ml  # heavy (sklearn); only needed by this tool
+    version = data_version()
+    if _predictions["frame"] is None or _predictions["version"] != version:
+        with _predictions_lock:
+            # Concurrent first calls wait for one build instead of training twice
+            if _predictions["frame"] is None or _predictions["version"] != version:
+                db = _db()
+                frame = ml.predict_all(db, ml.ensure_model(db))
+                frame["price_m"] = frame["now_cost"] / 10
+                _predictions.update(version=version,
+                                    frame=frame.sort_values("pred_next_points", ascending=False))
+    return _predictions["frame"]
+
+@metrics.timed_fn("tool")
+def predict_next_points(position: Optional[str] = None, limit: int = 10,
+                        max_price: Optional[float] = None) -> List[Dict[str, Any]]:
+    try:
+        df = _prediction_frame()
+    except RuntimeError as e:
+        return [{"error": str(e)}]
+    if position and position.upper() in POS_MAP:
+        df = df[df["element_type"] == POS_MAP[position.upper()]]
+    if max_price is not None:
+        df = df[df["price_m"] <= float(max_price)]
+    out = df.head(int(limit))[["id", "web_name", "element_type", "team", "price_m", "pred_next_points"]]
+    return [
+        {**r, "pred_next_points": round(float(r["pred_next_points"]), 2)}
+        for r in out.astype(object).where(out.notna(), None).to_dict("records")
+    ]
+
+# 7) Pick a full squad (or the best transfers) within budget (see squad_optimizer.py)
+@metrics.timed_fn("tool")
+def optimize_squad(budget: float = 100.0, current_squad: Optional[List[Any]] = None,
+                   max_transfers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    15-man squad maximising predicted next-GW points under the budget (£m), the
+    2/5/5/3 position quotas and the 3-per-club limit. With current_squad (ids or
+    names) at most max_transfers players are swapped and budget is squad value + bank.
+    """
+    try:
+        df = _prediction_frame()
+    except RuntimeError as e:
+        return {"error": str(e)}
+    current = []
+    for p in current_squad or []:
+        if isinstance(p, int) or str(p).isdigit():
+            current.append(int(p))
+            continue
+        matches = resolve_player(str(p), limit=1)
+        if not matches:
+            return {"error": f"No player matches '{p}'"}
+        current.append(matches[0]["id"])
+    df = df.dropna(subset=["pred_next_points", "now_cost", "team", "element_type"])
+    result = SquadOptimizer(df["id"].to_numpy(), df["element_type"], df["team"], df["now_cost"],
+                            df["pred_next_points"], budget=int(round(budget * 10)),
+                            current=current, max_transfers=max_transfers).solve()
+    if "error" in result:
+        return result
+    picked = df.iloc[result.pop("chosen")].sort_values(["element_type", "pred_next_points"],
+                                                       ascending=[True, False])
+    squad = [
+        {"id": int(r.id), "web_name": r.web_name, "position": POS_NAMES[int(r.element_type)],
+         "team": int(r.team), "price_m": round(float(r.price_m), 1),
+         "pred_next_points": round(float(r.pred_next_points), 2)}
+        for r in picked.itertuples()
     ]
-    return list(db.player_snapshots.aggregate(pipeline))
+    out = {"squad": squad, "total_cost_m": round(float(picked["now_cost"].sum()) / 10, 1),
+           "pred_points": round(result["value"], 2), "optimal": result["optimal"],
+           "upper_bound": round(result["upper_bound"], 2), "seconds": result["seconds"]}
+    if current:
+        names = dict(zip(df["id"], df["web_name"]))
+        out["transfers_out"] = [{"id": i, "web_name": names.get(i)} for i in current if i not in set(picked["id"])]
+        out["transfers_in"] = [{"id": p["id"], "web_name": p["web_name"]} for p in squad if p["id"] not in current]
+    return out
+
+# 8) "A cheaper X": nearest neighbours by playing profile (see similarity.py)
+_similarity = {"version": None, "index": None}
+
+def _similarity_index():
+    import similarity  # sklearn; only needed by this tool
+    version = data_version()
+    if _similarity["index"] is None or _similarity["version"] != version:
+        _similarity.update(version=version, index=similarity.SimilarityIndex.build(_db(), snapshot_cache.columns()))
+    return _similarity["index"]
+
+@metrics.timed_fn("tool")
+def similar_players(name: str, max_price: Optional[float] = None, limit: int = 5,
+                    position: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Players with the closest xG/xA/xGI per 90, recent form, minutes share and
+    price to `name`. Same position by default; position="ANY" searches all.
+    """
+    matches = resolve_player(name)
+    if not matches:
+        return {"error": f"No player matches '{name}'"}
+    index = _similarity_index()
+    ref = matches[0]["id"]
+    if ref not in index.pos_of:
+        return {"error": f"{matches[0]['web_name']} has no minutes to compare on"}
+    if position and position.upper() == "ANY":
+        element_type = None
+    elif position and position.upper() in POS_MAP:
+        element_type = POS_MAP[position.upper()]
+    else:
+        element_type = int(index.pos[index.pos_of[ref]])
+    similar = index.similar(ref, int(limit), max_price, element_type)
+    return {"player": index.record(index.rows[index.pos_of[ref]]),
+            "similar": [{**index.record(i), "distance": round(d, 3)} for i, d in similar]}
@@ -6,12 +6,26 @@ from dotenv import load_dotenv
 
 # Local tools you already created
 import agent_tools as tools
-from agent import chat_once  # uses your OpenAI key and tool-calling
+from agent import chat_stream, response_cache  # uses your OpenAI key and tool-calling
+from mongo_conn import pool_stats, data_version
+from result_cache import LRUCache, make_key
+import metrics
 
 load_dotenv()
 
 st.set_page_config(page_title="FPL xG – AI", page_icon="⚽", layout="wide")
 
+# --- Query cache ---
+# Streamlit reruns the whole script on every widget change; keep dashboard query
+# results per (tool, args, data version) so reruns don't go back to Mongo.
+@st.cache_resource
+def query_cache() -> LRUCache:
+    return LRUCache(maxsize=int(os.getenv("DASHBOARD_CACHE_SIZE", "128")))
+
+def cached_query(tool_name: str, **kwargs):
+    key = make_key(tool_name, kwargs, data_version())
+    return query_cache().get_or_compute(key, lambda: getattr(tools, tool_name)(**kwargs))
+
 # --- Sidebar ---
 st.sidebar.title("⚙️ Controls")
 
@@ -21,24 +35,55 @@ with st.sidebar.expander("Filters", expanded=True):
     limit = st.slider("Rows to show", min_value=5, max_value=50, value=15)
 
 st.sidebar.markdown("---")
+full_refresh = st.sidebar.checkbox("Full refresh (all histories)", value=False)
 if st.sidebar.button("🔄 Refresh FPL data"):
-    with st.status("Refreshing data from FPL API…", expanded=True) as status:
-        out = tools.refresh_data()
-        st.write(out)
-        status.update(label="Refresh complete", state="complete", expanded=False)
+    tools.refresh_data(full=full_refresh)
+
+# The refresh runs on a background thread; this panel polls it every 2s
+# without rerunning the rest of the page.
+@st.fragment(run_every=2)
+def refresh_panel():
+    job = tools.refresh_status()
+    if "error" in job:
+        return
+    if job["status"] == "running":
+        done, total = job["players_done"], job["players_total"]
+        label = f"Refreshing — {job['stage']}" + (f" ({done}/{total} players)" if total else "")
+        st.progress(done / total if total else 0.0, text=label)
+        if st.button("✖ Cancel refresh"):
+            tools.cancel_refresh(job["job_id"])
+        return
+    if job["status"] == "done":
+        st.caption(f"✅ Last refresh finished in {job['elapsed_s']}s")
+    else:
+        st.caption(f"⚠️ Last refresh {job['status']}: {job['error']}")
+    if st.session_state.get("refresh_seen") != job["job_id"]:
+        st.session_state["refresh_seen"] = job["job_id"]
+        if job["status"] == "done":
+            query_cache().clear()
+            tools.snapshot_cache.invalidate()
+            st.rerun()
+
+with st.sidebar:
+    refresh_panel()
 
 st.sidebar.markdown("---")
 st.sidebar.caption("ENV check")
 st.sidebar.write("Mongo URI set:", bool(os.getenv("MONGO_URI")))
 st.sidebar.write("OpenAI key set:", bool(os.getenv("OPENAI_API_KEY")))
+with st.sidebar.expander("Mongo pool"):
+    st.json(pool_stats())
+    st.caption("Query cache")
+    st.json(query_cache().stats())
 
 # --- Tabs ---
-tab1, tab2, tab3, tab4 = st.tabs(["🏆 Captain picks", "📈 xGI Leaders", "💸 Value picks", "💬 Ask the Agent"])
+tab1, tab2, tab3, tab6, tab4, tab5 = st.tabs(["🏆 Captain picks", "📈 xGI Leaders", "💸 Value picks",
+                                              "🗓️ Fixture projections", "💬 Ask the Agent", "🩺 Diagnostics"])
 
 # --- Captain picks ---
 with tab1:
     st.subheader("Suggested Captain Options")
-    data = tools.captain_suggestion(min_minutes=min_minutes, limit=limit)
+    data = cached_query("captain_suggestion", min_minutes=min_minutes, limit=limit)
     if not data:
         st.info("No data yet — try refreshing.")
     else:
@@ -65,7 +110,7 @@ with tab1:
 with tab2:
     st.subheader("xGI per 90 — Leaders")
     pos = None if position == "Any" else position
-    data = tools.top_xgi(min_minutes=min_minutes, position=pos, limit=limit)
+    data = cached_query("top_xgi", min_minutes=min_minutes, position=pos, limit=limit)
     if not data:
         st.info("No data yet — try refreshing.")
     else:
@@ -84,7 +129,7 @@ with tab2:
 with tab3:
     st.subheader("Value Picks — xGI/90 per £m")
     pos = None if position == "Any" else position
-    data = tools.value_picks(min_minutes=min_minutes, position=pos, limit=limit)
+    data = cached_query("value_picks", min_minutes=min_minutes, position=pos, limit=limit)
     if not data:
         st.info("No data yet — try refreshing.")
     else:
@@ -99,6 +144,25 @@ with tab3:
             "web_name":"Player","minutes":"Minutes","xgi90_per_m":"xGI/90 per £m"
         }))
 
+# --- Fixture projections ---
+with tab6:
+    st.subheader("Projected points — next gameweeks")
+    horizon = st.slider("Gameweeks ahead", min_value=1, max_value=10, value=5)
+    pos = None if position == "Any" else position
+    data = cached_query("fixture_projection", horizon=horizon, position=pos, limit=limit, min_minutes=min_minutes)
+    if not data:
+        st.info("No data yet — try refreshing.")
+    else:
+        pos_map = {1:"GK",2:"DEF",3:"MID",4:"FWD"}
+        df = pd.DataFrame(data)
+        by_gw = pd.DataFrame(list(df["xpts_by_gw"])).add_prefix("GW")
+        df = pd.concat([df.drop(columns=["xpts_by_gw"]), by_gw], axis=1)
+        df["Pos"] = df["element_type"].map(pos_map)
+        show_cols = ["web_name","Pos","team","price_m","xpts_total",*by_gw.columns]
+        st.dataframe(df[show_cols].rename(columns={
+            "web_name":"Player","team":"Team","price_m":"£m","xpts_total":"xPts"
+        }))
+
 # --- Chat agent ---
 with tab4:
     st.subheader("Ask the Agent")
@@ -108,6 +172,47 @@ with tab4:
         if not os.getenv("OPENAI_API_KEY"):
             st.error("Missing OPENAI_API_KEY in environment or .env")
         else:
-            with st.spinner("Thinking…"):
-                ans = chat_once(q)
-            st.write(ans)
+            status = st.status("Thinking…")
+
+            def answer_tokens():
+                # Tool progress goes to the status box; answer text streams below it
+                for ev in chat_stream(q):
+                    if ev["type"] == "tool_start":
+                        status.update(label=f"Running {ev['name']}…")
+                        status.write(f"→ `{ev['name']}` {ev['args']}")
+                    elif ev["type"] == "tool_done":
+                        status.write(f"{'✓' if ev['ok'] else '✗'} `{ev['name']}`")
+                    elif ev["type"] == "token":
+                        yield ev["text"]
+                    elif ev["type"] == "done":
+                        status.update(label="Answered from cache" if ev["cached"] else "Done",
+                                      state="complete", expanded=False)
+
+            st.write_stream(answer_tokens())
+
+# --- Diagnostics ---
+with tab5:
+    st.subheader("Diagnostics")
+    st.caption(f"Data version: {data_version()} · snapshot cache version: {tools.snapshot_cache.version}")
+    rows = metrics.snapshot()
+    timings = [r for r in rows if r["type"] == "timing"]
+    counters = [r for r in rows if r["type"] == "counter"]
+    if not rows:
+        st.info("No metrics recorded in this process yet.")
+    if timings:
+        st.markdown("**Timings** (ETL stages, FPL fetches, bulk writes, tools, OpenAI calls)")
+        st.dataframe(pd.DataFrame(timings).drop(columns=["type"]).fillna(""))
+    if counters:
+        st.markdown("**Counters** (documents written, tokens, retries, HTTP cache)")
+        st.dataframe(pd.DataFrame(counters).drop(columns=["type"]).fillna(""))
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Mongo pool**")
+        st.json(pool_stats())
+    with col2:
+        st.markdown("**Query cache**")
+        st.json(query_cache().stats())
+        st.markdown("**Agent response cache**")
+        st.json(response_cache.stats())
+    st.download_button("Download Prometheus metrics", metrics.prometheus_text(),
+                       file_name="metrics.prom", mime="text/plain")
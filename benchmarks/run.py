@@ -0,0 +1,149 @@
+# benchmarks/run.py
+# Times the ETL stages, every agent tool and model training against synthetic
+# FPL data served through fpl_http's replay mode, and writes the timings as JSON.
+#
+#   python -m benchmarks.run --players 700 --gameweeks 38 --seasons 2
+#   python -m benchmarks.run --backend mongomock      # in-memory stand-in, no mongod
+import os, sys, json, time, argparse, platform, statistics, subprocess, tempfile, datetime
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Benchmark ETL, agent tools and training on synthetic data.")
+    ap.add_argument("--players", type=int, default=700)
+    ap.add_argument("--gameweeks", type=int, default=38)
+    ap.add_argument("--seasons", type=int, default=1)
+    ap.add_argument("--teams", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=5, help="runs per tool benchmark")
+    ap.add_argument("--backend", choices=["mongo", "mongomock"], default="mongo",
+                    help="mongo = MONGO_URI (a local mongod); mongomock = in-memory stand-in")
+    ap.add_argument("--db-name", default="fpl_bench", help="scratch database (dropped first; must contain 'bench')")
+    ap.add_argument("--out", default=None, help="results file (default bench_results/<time>-<commit>.json)")
+    ap.add_argument("--skip-training", action="store_true")
+    return ap.parse_args()
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+class Bench:
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, fn, repeat=1):
+        times, error = [], None
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                error = repr(e)
+                break
+            times.append(time.perf_counter() - t0)
+        self.results[name] = {
+            "seconds": [round(t, 6) for t in times],
+            "min": round(min(times), 6) if times else None,
+            "median": round(statistics.median(times), 6) if times else None,
+            "ok": error is None,
+            "error": error,
+        }
+        status = f"{self.results[name]['median']:.4f}s" if times and not error else f"ERROR {error}"
+        print(f"{name:<40} {status}")
+
+def main():
+    args = parse_args()
+    if "bench" not in args.db_name:
+        sys.exit("--db-name must contain 'bench' (the database is dropped before the run)")
+
+    snapshot_dir = tempfile.mkdtemp(prefix="fpl_bench_")
+    # Configure modules through the environment before they are imported
+    os.environ.update({"FPL_HTTP_MODE": "replay", "FPL_SNAPSHOT_DIR": snapshot_dir,
+                       "DB_NAME": args.db_name, "MODEL_DIR": os.path.join(snapshot_dir, "models"),
+                       "FPL_FETCH_RATE": "0"})
+
+    from benchmarks.synthetic import make_dataset, write_snapshot
+    import mongo_conn
+    if args.backend == "mongomock":
+        import mongomock
+        mongo_conn.set_client(mongomock.MongoClient())
+
+    bench = Bench()
+    t0 = time.perf_counter()
+    data = make_dataset(args.players, args.gameweeks, args.seasons, args.teams, seed=args.seed)
+    urls = write_snapshot(data, snapshot_dir)
+    print(f"Synthetic data: {args.players} players x {args.gameweeks * args.seasons} GWs "
+          f"({urls} payloads) in {time.perf_counter() - t0:.1f}s")
+
+    import etl_fpl_to_mongo as etl
+    mongo_conn.get_client().drop_database(args.db_name)
+    db = mongo_conn.get_db()
+
+    # ETL stages (single run each; later stages depend on earlier ones)
+    bench.run("etl.ensure_indexes", lambda: etl.ensure_indexes(db))
+    bench.run("etl.load_bootstrap", lambda: etl.load_bootstrap(db))
+    bench.run("etl.load_player_history[full]", lambda: etl.load_player_history(db, max_players=None))
+    bench.run("etl.refresh_player_features", lambda: etl.refresh_player_features(db))
+    bench.run("etl.load_fixtures", lambda: etl.load_fixtures(db))
+    bench.run("etl.load_player_history[incremental]",
+              lambda: etl.load_player_history(db, max_players=None, incremental=True))
+    mongo_conn.bump_data_version(db)
+
+    # Agent tools, against Mongo and against the in-memory snapshot cache
+    import agent_tools as tools
+    name = data["bootstrap"]["elements"][0]["web_name"]
+    calls = {
+        "top_xgi": lambda: tools.top_xgi(300, None, 10),
+        "top_xgi[MID]": lambda: tools.top_xgi(300, "MID", 10),
+        "value_picks": lambda: tools.value_picks(300, None, 10),
+        "captain_suggestion": lambda: tools.captain_suggestion(300, 10),
+        "recent_trend": lambda: tools.recent_trend(name, 5),
+    }
+    for use_cache in (False, True):
+        tools.USE_SNAPSHOT_CACHE = use_cache
+        label = "cache" if use_cache else "mongo"
+        for tool, fn in calls.items():
+            if use_cache and tool == "recent_trend":
+                continue
+            fn()  # warm-up (loads caches / name index)
+            bench.run(f"tool.{tool}[{label}]", fn, repeat=args.repeat)
+
+    # Tools that keep their own per-data-version state (first call builds it)
+    stateful = {
+        "price_trend": lambda: tools.price_trend(name, 5),
+        "fixture_projection": lambda: tools.fixture_projection(5, None, 10),
+        "similar_players": lambda: tools.similar_players(name, None, 5),
+    }
+    for tool, fn in stateful.items():
+        bench.run(f"tool.{tool}[cold]", fn)
+        bench.run(f"tool.{tool}", fn, repeat=args.repeat)
+
+    if not args.skip_training:
+        import ml_predict_next_points as ml
+        bench.run("ml.ensure_model[train]", lambda: ml.ensure_model(db, force=True))
+        bench.run("ml.predict_all", lambda: ml.predict_all(db, ml.load_model(mongo_conn.get_data_version(db))),
+                  repeat=args.repeat)
+        tools.predict_next_points(limit=10)  # warm-up: loads artifact, caches predictions
+        bench.run("tool.predict_next_points", lambda: tools.predict_next_points(limit=10), repeat=args.repeat)
+        bench.run("tool.optimize_squad", lambda: tools.optimize_squad(100.0), repeat=args.repeat)
+        squad = [p["id"] for p in tools.optimize_squad(90.0).get("squad", [])]
+        bench.run("tool.optimize_squad[transfers]",
+                  lambda: tools.optimize_squad(100.0, current_squad=squad, max_transfers=2), repeat=args.repeat)
+
+    out = args.out or os.path.join(
+        "bench_results", f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S}-{git_commit()}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "backend": args.backend,
+            "python": platform.python_version(),
+            "params": {k: getattr(args, k) for k in ("players", "gameweeks", "seasons", "teams", "seed", "repeat")},
+            "results": bench.results,
+        }, f, indent=2)
+    print(f"\nWrote {out}")
+    mongo_conn.get_client().drop_database(args.db_name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/synthetic.py
+# Synthetic FPL API payloads (bootstrap-static, element-summary, fixtures) at a
+# configurable scale, plus a writer that stores them as an fpl_http replay snapshot.
+import json, datetime, random
+from typing import Dict, Any
+from fpl_http import ResponseStore
+
+BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
+FIXTURES_URL  = "https://fantasy.premierleague.com/api/fixtures/"
+SUMMARY_URL   = "https://fantasy.premierleague.com/api/element-summary/{player_id}/"
+
+POSITION_SHARE = [(1, 0.1), (2, 0.33), (3, 0.4), (4, 0.17)]
+SURNAMES = ["Smith", "Silva", "Müller", "Ødegaard", "Son", "Johnson", "García", "Kovač",
+            "Nakamura", "Okafor", "Dubois", "Rossi", "Jensen", "Novak", "Costa", "Brown"]
+
+def _fixtures(n_teams: int, n_gws: int, start: datetime.datetime, rng: random.Random):
+    """Round-robin pairings (circle method), repeated as needed to cover n_gws."""
+    teams = list(range(1, n_teams + 1))
+    fixtures = []
+    for gw in range(1, n_gws + 1):
+        r = (gw - 1) % (n_teams - 1)
+        rot = [teams[0]] + teams[1:][r:] + teams[1:][:r]
+        kickoff = start + datetime.timedelta(days=7 * (gw - 1))
+        for i in range(n_teams // 2):
+            h, a = (rot[i], rot[-1 - i]) if gw % 2 else (rot[-1 - i], rot[i])
+            fixtures.append({
+                "id": len(fixtures) + 1, "event": gw, "team_h": h, "team_a": a,
+                "team_h_difficulty": rng.randint(2, 5), "team_a_difficulty": rng.randint(2, 5),
+                "kickoff_time": kickoff.isoformat() + "Z", "finished": False,
+            })
+    return fixtures
+
+def make_dataset(players: int = 700, gameweeks: int = 38, seasons: int = 1, teams: int = 20,
+                 played: int = None, seed: int = 0) -> Dict[str, Any]:
+    """
+    Returns {"bootstrap", "summaries" (player id -> element-summary), "fixtures"}.
+    Seasons are laid end to end: rounds run 1..gameweeks*seasons, so history
+    size scales with players x gameweeks x seasons.
+    """
+    rng = random.Random(seed)
+    n_gws = gameweeks * seasons
+    played = n_gws - 2 if played is None else played
+    start = datetime.datetime(2024, 8, 16, 19, 0)
+
+    events = [{
+        "id": gw, "name": f"Gameweek {gw}",
+        "deadline_time": (start + datetime.timedelta(days=7 * (gw - 1))).isoformat() + "Z",
+        "finished": gw <= played, "data_checked": gw <= played,
+        "is_current": gw == played, "is_next": gw == played + 1,
+    } for gw in range(1, n_gws + 1)]
+    team_docs = [{
+        "id": t, "name": f"Team {t}", "short_name": f"T{t:02d}",
+        "strength_attack_home": rng.randint(1000, 1350), "strength_attack_away": rng.randint(1000, 1350),
+        "strength_defence_home": rng.randint(1000, 1350), "strength_defence_away": rng.randint(1000, 1350),
+    } for t in range(1, teams + 1)]
+    fixtures = _fixtures(teams, n_gws, start, rng)
+    for f in fixtures:
+        f["finished"] = f["event"] <= played
+
+    elements, summaries = [], {}
+    for pid in range(1, players + 1):
+        pos = rng.choices([p for p, _ in POSITION_SHARE], [w for _, w in POSITION_SHARE])[0]
+        talent = rng.random()
+        xgi_rate = {1: 0.0, 2: 0.08, 3: 0.3, 4: 0.45}[pos] * (0.3 + 1.4 * talent)
+        starter = rng.random() < 0.6
+        history = []
+        for rnd in range(1, played + 1):
+            mins = rng.choice([90, 90, 90, 75, 60, 0]) if starter else rng.choice([0, 0, 0, 15, 30, 90])
+            xg = xgi_rate * 0.6 * mins / 90 * rng.uniform(0.2, 1.8)
+            xa = xgi_rate * 0.4 * mins / 90 * rng.uniform(0.2, 1.8)
+            goals = int(rng.random() < xg)
+            history.append({
+                "element": pid, "round": rnd, "fixture": rnd, "opponent_team": rng.randint(1, teams),
+                "was_home": rng.random() < 0.5, "minutes": mins,
+                "total_points": (2 if mins >= 60 else 1 if mins else 0) + goals * 5 + int(rng.random() < xa) * 3,
+                "goals_scored": goals, "assists": 0, "bps": rng.randint(0, 40) if mins else 0,
+                "expected_goals": f"{xg:.2f}", "expected_assists": f"{xa:.2f}",
+                "expected_goal_involvements": f"{xg + xa:.2f}",
+                "value": 40 + int(talent * 90), "selected": rng.randint(1000, 5_000_000),
+                "season": (rnd - 1) // gameweeks + 1,
+            })
+        summaries[pid] = {"history": history, "fixtures": [], "history_past": []}
+        minutes = sum(h["minutes"] for h in history)
+        per90 = lambda key: round(sum(float(h[key]) for h in history) / minutes * 90, 2) if minutes else 0.0
+        surname = rng.choice(SURNAMES)
+        elements.append({
+            "id": pid, "web_name": f"{surname}{pid}", "first_name": f"Player{pid}", "second_name": surname,
+            "team": rng.randint(1, teams), "element_type": pos, "now_cost": 40 + int(talent * 90),
+            "status": "a" if rng.random() < 0.9 else "d",
+            "chance_of_playing_next_round": None if rng.random() < 0.85 else rng.choice([0, 25, 50, 75]),
+            "minutes": minutes, "starts": sum(h["minutes"] >= 60 for h in history),
+            "total_points": sum(h["total_points"] for h in history),
+            "event_points": history[-1]["total_points"] if history else 0,
+            "goals_scored": sum(h["goals_scored"] for h in history), "assists": 0,
+            "bps": sum(h["bps"] for h in history),
+            "expected_goals": f"{sum(float(h['expected_goals']) for h in history):.2f}",
+            "expected_assists": f"{sum(float(h['expected_assists']) for h in history):.2f}",
+            "expected_goal_involvements": f"{sum(float(h['expected_goal_involvements']) for h in history):.2f}",
+            "expected_goals_per_90": per90("expected_goals"),
+            "expected_assists_per_90": per90("expected_assists"),
+            "expected_goal_involvements_per_90": per90("expected_goal_involvements"),
+            "selected_by_percent": f"{rng.uniform(0, 60):.1f}", "form": f"{rng.uniform(0, 10):.1f}",
+            "transfers_in_event": rng.randint(0, 200_000), "transfers_out_event": rng.randint(0, 200_000),
+        })
+
+    return {
+        "bootstrap": {"elements": elements, "teams": team_docs, "events": events, "element_types": []},
+        "summaries": summaries,
+        "fixtures": fixtures,
+    }
+
+def write_snapshot(dataset: Dict[str, Any], directory: str) -> int:
+    """Stores the payloads where fpl_http's replay mode will find them; returns URLs written."""
+    store = ResponseStore(directory)
+    store.save(BOOTSTRAP_URL, json.dumps(dataset["bootstrap"]).encode(), {})
+    store.save(FIXTURES_URL, json.dumps(dataset["fixtures"]).encode(), {})
+    for pid, summary in dataset["summaries"].items():
+        store.save(SUMMARY_URL.format(player_id=pid), json.dumps(summary).encode(), {})
+    return 2 + len(dataset["summaries"])
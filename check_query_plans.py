@@ -0,0 +1,60 @@
+# check_query_plans.py
+# Explains every tool query against the live database and fails (exit 1) if any
+# of them falls back to a COLLSCAN. Run after ensure_indexes / an ETL refresh.
+import sys
+from dotenv import load_dotenv
+from mongo_conn import get_db, close_client
+import agent_tools as tools
+
+load_dotenv()
+
+def tool_queries(db):
+    """(label, collection, pipeline) for each query shape the tools issue."""
+    any_player = db.player_snapshots.find_one({}, {"id": 1}) or {"id": 0}
+    queries = [
+        ("top_xgi", "player_snapshots", tools._top_xgi_pipeline(300, None, 10)),
+        ("value_picks", "player_snapshots", tools._value_picks_pipeline(300, None, 10)),
+        ("captain_suggestion", "player_snapshots", tools._captain_pipeline(300, 10)),
+        ("recent_trend", "player_history", tools._recent_history_pipeline(any_player["id"], 5)),
+        ("latest features", "player_features", [{"$match": {"is_latest": True}}]),
+    ]
+    for pos in tools.POS_MAP:
+        queries.append((f"top_xgi {pos}", "player_snapshots", tools._top_xgi_pipeline(300, pos, 10)))
+        queries.append((f"value_picks {pos}", "player_snapshots", tools._value_picks_pipeline(300, pos, 10)))
+    return queries
+
+def plan_stages(node) -> set:
+    """All 'stage' names anywhere in an explain document."""
+    stages = set()
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            stages.add(node["stage"])
+        for v in node.values():
+            stages |= plan_stages(v)
+    elif isinstance(node, list):
+        for v in node:
+            stages |= plan_stages(v)
+    return stages
+
+def explain(db, coll: str, pipeline: list) -> dict:
+    return db.command("explain", {"aggregate": coll, "pipeline": pipeline, "cursor": {}},
+                      verbosity="queryPlanner")
+
+def main() -> int:
+    db = get_db()
+    failed = []
+    for label, coll, pipeline in tool_queries(db):
+        stages = plan_stages(explain(db, coll, pipeline))
+        ok = "COLLSCAN" not in stages
+        print(f"{'OK  ' if ok else 'FAIL'} {label:<22} {coll:<18} {', '.join(sorted(stages))}")
+        if not ok:
+            failed.append(label)
+    close_client()
+    if failed:
+        print(f"\n{len(failed)} quer{'y' if len(failed) == 1 else 'ies'} fell back to COLLSCAN: {', '.join(failed)}")
+        return 1
+    print("\nAll tool queries use indexes.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
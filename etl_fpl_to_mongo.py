@@ -1,73 +1,387 @@
-import os, requests, datetime
-from pymongo import MongoClient, ASCENDING
+import os, time, json, hashlib, argparse, datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
+from mongo_conn import get_db, bump_data_version
+from features import build_features, history_fields, window_pipeline
+from name_index import search_keys
+from fpl_http import TokenBucket, fetch_json, FETCH_WORKERS, FETCH_RATE
+import metrics
+import snapshot_history
+import parquet_export
 
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME   = os.getenv("DB_NAME", "fpl")
 
 BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
 FIXTURES_URL  = "https://fantasy.premierleague.com/api/fixtures/"
 SUMMARY_URL   = "https://fantasy.premierleague.com/api/element-summary/{player_id}/"
 
+# Fetch tuning (workers, rate, retries, HTTP cache and record/replay) lives in fpl_http.py
+MAX_PLAYERS   = int(os.getenv("FPL_MAX_PLAYERS", "0")) or None    # 0/unset = all players
+WRITE_BATCH   = int(os.getenv("FPL_WRITE_BATCH", "1000"))     # ops per bulk_write
+ATOMIC_BOOTSTRAP = os.getenv("FPL_ATOMIC_BOOTSTRAP", "0") == "1"  # swap teams/events in like fixtures
+PARQUET_EXPORT = os.getenv("PARQUET_EXPORT", "1") == "1"          # training copy, see parquet_export.py
+
+class Cancelled(Exception):
+    """Raised when a refresh is cancelled through its `cancel` event."""
+
+# Bootstrap fields that move whenever a player's element-summary history does.
+# Their hash is the per-player fingerprint used by incremental refreshes.
+HISTORY_FIELDS = [
+    "minutes", "starts", "total_points", "event_points", "goals_scored", "assists",
+    "clean_sheets", "goals_conceded", "own_goals", "penalties_saved", "penalties_missed",
+    "yellow_cards", "red_cards", "saves", "bonus", "bps",
+    "expected_goals", "expected_assists", "expected_goal_involvements", "expected_goals_conceded",
+]
+
+# Indexes for collections that can be reloaded through a staging copy; they are
+# built on the staging collection before it is swapped in (see swap_in).
+SWAP_INDEXES = {
+    "teams": [([("id", ASCENDING)], {"unique": True})],
+    "events": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("finished", ASCENDING), ("data_checked", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+    "fixtures": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("event", ASCENDING)], {}),
+        ([("team_h", ASCENDING), ("event", ASCENDING)], {}),
+        ([("team_a", ASCENDING), ("event", ASCENDING)], {}),
+        ([("kickoff_time", ASCENDING)], {}),
+    ],
+}
+
 def mongo():
-    client = MongoClient(MONGO_URI)
-    return client[DB_NAME]
+    return get_db()
 
 def ensure_indexes(db):
     db.players.create_index([("id", ASCENDING)], unique=True)
-    db.teams.create_index([("id", ASCENDING)], unique=True)
-    db.events.create_index([("id", ASCENDING)], unique=True)
+    for name, indexes in SWAP_INDEXES.items():
+        for keys, opts in indexes:
+            db[name].create_index(keys, **opts)
     db.player_history.create_index([("player_id", ASCENDING), ("round", ASCENDING)], unique=True)
     db.player_snapshots.create_index([("id", ASCENDING)], unique=True)
+    # Leaderboard indexes: equality (element_type), sort key, then the minutes range.
+    # Partial on minutes > 0, which every leaderboard query implies.
+    played = {"minutes": {"$gt": 0}}
+    for sort_key in ("expected_goal_involvements_per_90", "xgi90_per_m", "captain_score"):
+        db.player_snapshots.create_index([(sort_key, DESCENDING), ("minutes", ASCENDING)],
+                                         partialFilterExpression=played)
+        db.player_snapshots.create_index([("element_type", ASCENDING), (sort_key, DESCENDING), ("minutes", ASCENDING)],
+                                         partialFilterExpression=played)
+    db.player_features.create_index([("player_id", ASCENDING), ("round", ASCENDING)], unique=True)
+    snapshot_history.ensure_indexes(db)
+    db.player_features.create_index([("is_latest", ASCENDING), ("player_id", ASCENDING)], name="latest_features",
+                                    partialFilterExpression={"is_latest": True})
+
+def content_hash(doc: dict) -> str:
+    return hashlib.sha1(json.dumps(doc, sort_keys=True, default=str).encode()).hexdigest()
+
+def player_fingerprint(p: dict) -> str:
+    return content_hash({f: p.get(f) for f in HISTORY_FIELDS})
+
+def _num(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+def leaderboard_fields(p: dict) -> dict:
+    """Sort keys for the leaderboard tools, stored on the snapshot so they can be indexed."""
+    xgi90 = _num(p.get("expected_goal_involvements_per_90"))
+    price_m = (p.get("now_cost") or 0) / 10
+    chance = _num(p.get("chance_of_playing_next_round"))
+    chance_f = chance / 100 if chance and chance > 0 else 0.9  # unknown/zero counts as 90%
+    return {
+        "xgi90_per_m": xgi90 / price_m if xgi90 is not None and price_m > 0 else None,
+        "captain_chance": chance_f,
+        "captain_score": xgi90 * chance_f if xgi90 is not None else None,
+    }
+
+def latest_checked_event(db) -> int:
+    """Id of the most recent gameweek that is finished and data_checked (0 if none)."""
+    e = db.events.find_one({"finished": True, "data_checked": True}, {"id": 1}, sort=[("id", -1)])
+    return e["id"] if e else 0
+
+class BulkWriter:
+    """
+    Buffers UpdateOne upserts per collection and flushes them as unordered
+    bulk_write calls of `batch_size` ops. Keeps inserted/modified/unchanged
+    counts per collection in `stats`.
+    """
+    def __init__(self, db, batch_size: int = WRITE_BATCH):
+        self.db = db
+        self.batch_size = max(1, int(batch_size))
+        self.pending = {}
+        self.stats = {}
+
+    def upsert(self, coll: str, filter: dict, doc: dict):
+        self.add(coll, UpdateOne(filter, {"$set": doc}, upsert=True))
+
+    def add(self, coll: str, op):
+        buf = self.pending.setdefault(coll, [])
+        buf.append(op)
+        if len(buf) >= self.batch_size:
+            self.flush(coll)
+
+    def flush(self, coll: str = None):
+        for name in ([coll] if coll else list(self.pending)):
+            ops = self.pending.pop(name, [])
+            if not ops:
+                continue
+            t0 = time.perf_counter()
+            res = self.db[name].bulk_write(ops, ordered=False)
+            elapsed = time.perf_counter() - t0
+            metrics.inc("mongo_docs_written_total", len(ops), collection=name)
+            metrics.observe("mongo_bulk_write_seconds", elapsed, collection=name)
+            metrics.emit("bulk_write", collection=name, docs=len(ops),
+                         docs_per_sec=round(len(ops) / elapsed, 1) if elapsed else None)
+            s = self.stats.setdefault(name, {"inserted": 0, "modified": 0, "unchanged": 0})
+            s["inserted"]  += res.upserted_count + res.inserted_count
+            s["modified"]  += res.modified_count
+            s["unchanged"] += res.matched_count - res.modified_count
+
+    def report(self):
+        for name, s in sorted(self.stats.items()):
+            print(f"  {name}: inserted={s['inserted']}, modified={s['modified']}, unchanged={s['unchanged']}")
 
-def fetch_json(url):
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    def __enter__(self):
+        return self
 
-def load_bootstrap(db):
+    def __exit__(self, *exc):
+        self.flush()
+
+def swap_in(db, name: str, docs: list):
+    """
+    Replaces collection `name` with `docs` without readers ever seeing it empty
+    or unindexed: docs go into <name>_staging, SWAP_INDEXES are built there, and
+    the staging collection is renamed over the live one in a single step.
+    """
+    staging = db[f"{name}_staging"]
+    staging.drop()
+    if docs:
+        staging.insert_many(docs, ordered=False)
+    else:
+        db.create_collection(staging.name)
+    for keys, opts in SWAP_INDEXES.get(name, []):
+        staging.create_index(keys, **opts)
+    staging.rename(name, dropTarget=True)
+
+def load_bootstrap(db, batch_size=WRITE_BATCH, atomic=ATOMIC_BOOTSTRAP):
     j = fetch_json(BOOTSTRAP_URL)
     players, teams, events = j["elements"], j["teams"], j["events"]
 
-    for p in players:
-        p["_ingestedAt"] = datetime.datetime.utcnow()
-        db.player_snapshots.update_one({"id": p["id"]}, {"$set": p}, upsert=True)
+    # Previous tracked values, so the time series only records what changed
+    tracked = {"_id": 0, "id": 1, **{f: 1 for f in snapshot_history.TRACKED_FIELDS}}
+    prev = {d["id"]: d for d in db.player_snapshots.find({}, tracked)}
+    event = snapshot_history.current_event(events)
 
-    for t in teams:
-        db.teams.update_one({"id": t["id"]}, {"$set": t}, upsert=True)
-    for e in events:
-        db.events.update_one({"id": e["id"]}, {"$set": e}, upsert=True)
+    now = datetime.datetime.utcnow()
+    with BulkWriter(db, batch_size) as w:
+        for p in players:
+            changes = snapshot_history.changed_fields(prev.get(p["id"]), p)
+            if changes:
+                w.add(snapshot_history.COLLECTION,
+                      snapshot_history.bucket_update(p["id"], event, prev.get(p["id"]), changes, now))
+            p["_ingestedAt"] = now
+            p["_fingerprint"] = player_fingerprint(p)
+            p.update(search_keys(p))
+            p.update(leaderboard_fields(p))
+            w.upsert("player_snapshots", {"id": p["id"]}, p)
+        if not atomic:
+            for t in teams:
+                w.upsert("teams", {"id": t["id"]}, t)
+            for e in events:
+                w.upsert("events", {"id": e["id"]}, e)
+    if atomic:
+        swap_in(db, "teams", teams)
+        swap_in(db, "events", events)
 
     print(f"Loaded players={len(players)}, teams={len(teams)}, events={len(events)}")
+    w.report()
+
+def _players_to_refresh(db, pids, fingerprints, checked_event):
+    """Players whose fingerprint changed, or who haven't been fetched since the last checked GW."""
+    state = {s["_id"]: s for s in db.history_state.find({"_id": {"$in": pids}})}
+    stale = []
+    for pid in pids:
+        s = state.get(pid)
+        if not s or s.get("fingerprint") != fingerprints.get(pid) or s.get("event", 0) < checked_event:
+            stale.append(pid)
+    return stale
+
+def load_player_history(db, max_players=150, workers=FETCH_WORKERS, rate=FETCH_RATE,
+                        batch_size=WRITE_BATCH, incremental=False, progress=None, cancel=None):
+    """
+    Fetches element-summary for the top `max_players` by minutes (None = everyone)
+    on a bounded thread pool, rate-limited to `rate` requests/second.
+    Players that still fail after retries are reported and skipped.
+
+    With incremental=True only players whose bootstrap fingerprint changed (or who
+    missed the latest finished + data_checked gameweek) are fetched, and only
+    history rows whose content hash differs from the stored one are written.
+    Returns the ids of players whose history rows changed.
+
+    `progress(done, total)` is called after each player; setting the `cancel`
+    event stops outstanding fetches and raises Cancelled (rows already
+    fetched are still written and flagged features_pending for the next run).
+    """
+    cursor = db.player_snapshots.find({}, {"id":1, "minutes":1, "_fingerprint":1}).sort("minutes", -1)
+    if max_players:
+        cursor = cursor.limit(int(max_players))
+    snaps = list(cursor)
+    pids = [p["id"] for p in snaps]
+    fingerprints = {p["id"]: p.get("_fingerprint") for p in snaps}
+
+    checked_event = latest_checked_event(db)
+    known = {}
+    if incremental:
+        total = len(pids)
+        pids = _players_to_refresh(db, pids, fingerprints, checked_event)
+        print(f"Incremental: {len(pids)}/{total} players need a history refresh (last checked GW={checked_event})")
+        for h in db.player_history.find({"player_id": {"$in": pids}}, {"player_id": 1, "round": 1, "_hash": 1}):
+            known[(h["player_id"], h["round"])] = h.get("_hash")
 
-def load_player_history(db, max_players=150):
-    players = list(db.player_snapshots.find({}, {"id":1, "minutes":1}).sort("minutes", -1).limit(max_players))
-    count = 0
-    for p in players:
-        pid = p["id"]
-        j = fetch_json(SUMMARY_URL.format(player_id=pid))
-        for row in j.get("history", []):
-            row["player_id"] = pid
-            db.player_history.update_one(
-                {"player_id": pid, "round": row["round"]},
-                {"$set": row},
-                upsert=True
-            )
-        count += 1
-    print(f"Loaded per-GW history for {count} players")
+    bucket = TokenBucket(rate) if rate else None
+    now = datetime.datetime.utcnow()
+    count, failed, changed = 0, [], []
+    with BulkWriter(db, batch_size) as w, ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        futures = {pool.submit(fetch_json, SUMMARY_URL.format(player_id=pid), bucket): pid for pid in pids}
+        if progress:
+            progress(0, len(pids))
+        for fut in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                for f in futures:
+                    f.cancel()
+                raise Cancelled(f"cancelled after {count}/{len(pids)} players")
+            pid = futures[fut]
+            try:
+                j = fut.result()
+            except Exception as e:
+                failed.append(pid)
+                print(f"  history fetch failed for player {pid}: {e!r}")
+                if progress:
+                    progress(count + len(failed), len(pids))
+                continue
+            dirty = False
+            for row in j.get("history", []):
+                row["player_id"] = pid
+                row["_hash"] = content_hash(row)
+                if incremental and known.get((pid, row["round"])) == row["_hash"]:
+                    continue
+                w.upsert("player_history", {"player_id": pid, "round": row["round"]}, row)
+                dirty = True
+            state = {"fingerprint": fingerprints.get(pid), "event": checked_event, "fetchedAt": now}
+            if dirty:
+                # Cleared once features are rebuilt, so a cancelled or failed run can't leave them stale
+                state["features_pending"] = True
+            w.upsert("history_state", {"_id": pid}, state)
+            if dirty:
+                changed.append(pid)
+            count += 1
+            if progress:
+                progress(count + len(failed), len(pids))
+    print(f"Loaded per-GW history for {count} players, {len(changed)} changed"
+          + (f" ({len(failed)} failed)" if failed else ""))
+    w.report()
+    return changed
+
+def features_pending(db) -> list:
+    """Players whose history changed in an earlier run that stopped before their features were rebuilt."""
+    return [s["_id"] for s in db.history_state.find({"features_pending": True}, {"_id": 1})]
+
+def refresh_player_features(db, player_ids=None, batch_size=WRITE_BATCH):
+    """
+    Recomputes rolling features in player_features for `player_ids` (None = all)
+    with $setWindowFields, falling back to a pandas batch on servers without it.
+    """
+    if player_ids is not None and not player_ids:
+        print("Features: nothing to update")
+        return
+    try:
+        db.player_history.aggregate(window_pipeline(player_ids), allowDiskUse=True)
+        print(f"Features: recomputed server-side for {'all' if player_ids is None else len(player_ids)} players")
+        return
+    except (OperationFailure, NotImplementedError) as e:
+        # Old servers (and in-memory stand-ins such as mongomock) lack $setWindowFields
+        print(f"Features: $setWindowFields unavailable ({getattr(e, 'code', type(e).__name__)}), computing in batch")
+
+    match = {"player_id": {"$in": list(player_ids)}} if player_ids is not None else {}
+    fields = history_fields()
+    hist = pd.DataFrame(list(db.player_history.find(match, {"_id": 0, **{f: 1 for f in fields}})))
+    if hist.empty:
+        return
+    feats = build_features(hist, with_target=False)
+    now = datetime.datetime.utcnow()
+    with BulkWriter(db, batch_size) as w:
+        for row in feats.astype(object).where(feats.notna(), None).to_dict("records"):
+            row["updatedAt"] = now
+            w.upsert("player_features", {"player_id": row["player_id"], "round": row["round"]}, row)
+    w.report()
 
 def load_fixtures(db):
     fixtures = fetch_json(FIXTURES_URL)
-    db.fixtures.drop()
-    if fixtures:
-        db.fixtures.insert_many(fixtures)
+    swap_in(db, "fixtures", fixtures)
     print(f"Loaded fixtures={len(fixtures)}")
 
+def run_etl(db=None, max_players=MAX_PLAYERS, full=False, progress=None, cancel=None) -> dict:
+    """
+    Runs the whole refresh in-process. `progress(stage, done, total)` reports
+    stage changes (bootstrap, history, features, fixtures, export) and, during history,
+    players done/total. Setting the `cancel` event raises Cancelled at the next
+    checkpoint; the data version is only bumped when every stage finished.
+    """
+    db = db if db is not None else mongo()
+    report = progress or (lambda stage, done=None, total=None: None)
+
+    @contextmanager
+    def stage(name):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled(f"cancelled before {name}")
+        report(name)
+        with metrics.timed("etl_stage", stage=name):
+            yield
+
+    t0 = time.perf_counter()
+    try:
+        with stage("indexes"):
+            ensure_indexes(db)
+        with stage("bootstrap"):
+            load_bootstrap(db)
+        with stage("history"):
+            changed = load_player_history(db, max_players=max_players, incremental=not full, cancel=cancel,
+                                          progress=lambda done, total: report("history", done, total))
+        with stage("features"):
+            todo = None if full else sorted(set(changed) | set(features_pending(db)))
+            refresh_player_features(db, todo)
+            done = {"features_pending": True} if todo is None else {"_id": {"$in": todo}}
+            db.history_state.update_many(done, {"$unset": {"features_pending": ""}})
+        with stage("fixtures"):
+            load_fixtures(db)
+        version = bump_data_version(db)
+        if PARQUET_EXPORT:
+            # A derived copy: a failed export leaves training on Mongo, not the refresh failed
+            report("export")
+            try:
+                with metrics.timed("etl_stage", stage="export"):
+                    parquet_export.export(db, version, rebuild=full)
+            except Exception as e:
+                print(f"Parquet export failed: {e!r}")
+        report("done")
+        metrics.emit("etl_run", seconds=round(time.perf_counter() - t0, 3), full=full,
+                     players_changed=len(changed), data_version=version)
+        return {"data_version": version, "players_changed": len(changed)}
+    finally:
+        metrics.write_prometheus()
+
 if __name__ == "__main__":
-    db = mongo()
-    ensure_indexes(db)
-    load_bootstrap(db)
-    load_player_history(db, max_players=150)
-    load_fixtures(db)
-    print("Done.")
+    ap = argparse.ArgumentParser(description="Load FPL API data into MongoDB.")
+    ap.add_argument("--full", action="store_true", help="re-fetch every player's history (default: incremental)")
+    ap.add_argument("--max-players", type=int, default=MAX_PLAYERS, help="limit history to the top N by minutes")
+    args = ap.parse_args()
+
+    result = run_etl(max_players=args.max_players, full=args.full)
+    print(f"Done. data_version={result['data_version']}")
@@ -0,0 +1,83 @@
+# features.py
+# Rolling per-player features built from player_history, vectorised with pandas.
+import os
+from typing import Dict, Sequence
+import numpy as np, pandas as pd
+
+# history field -> feature prefix; feature columns are named "<prefix>_l<window>"
+ROLLING_STATS: Dict[str, str] = {"expected_goal_involvements": "xgi", "minutes": "mins"}
+# Extra stats from the environment, e.g. FEATURE_EXTRA_STATS="total_points:pts,bps:bps"
+for _spec in filter(None, os.getenv("FEATURE_EXTRA_STATS", "").split(",")):
+    _field, _, _prefix = _spec.partition(":")
+    ROLLING_STATS[_field.strip()] = (_prefix or _field).strip()
+
+WINDOWS = tuple(int(w) for w in os.getenv("FEATURE_WINDOWS", "4").split(","))
+TARGET = "total_points"
+
+def history_fields(stats: Dict[str, str] = ROLLING_STATS, target: str = TARGET) -> list:
+    """player_history fields build_features reads, each once (the target may also be a rolling stat)."""
+    return list(dict.fromkeys(["player_id", "round", target, *stats]))
+
+def feature_columns(windows: Sequence[int] = WINDOWS, stats: Dict[str, str] = ROLLING_STATS):
+    return [f"{prefix}_l{w}" for prefix in stats.values() for w in windows]
+
+def build_features(hist: pd.DataFrame, windows: Sequence[int] = WINDOWS,
+                   stats: Dict[str, str] = ROLLING_STATS, target: str = TARGET,
+                   with_target: bool = True) -> pd.DataFrame:
+    """
+    One row per (player_id, round) with trailing means over the last `w` rounds
+    (current round included, fewer at the start of a player's history) and
+    `points_next`, the target's value in the player's following round.
+    with_target=True drops rows without a next-round target (training rows);
+    is_latest marks each player's most recent round (the live prediction row).
+    """
+    cols = history_fields(stats, target)
+    values = cols[2:]
+    df = hist.reindex(columns=cols).sort_values(["player_id", "round"], kind="stable").reset_index(drop=True)
+    for field in values:
+        df[field] = pd.to_numeric(df[field], errors="coerce")
+
+    g = df.groupby("player_id", sort=False)
+    n_seen = g.cumcount().to_numpy() + 1
+    for field, prefix in stats.items():
+        # Rolling mean via grouped cumulative sums: sum(last w) = cs[i] - cs[i-w]
+        cs = df[field].fillna(0).groupby(df["player_id"], sort=False).cumsum()
+        for w in windows:
+            lagged = cs.groupby(df["player_id"], sort=False).shift(w).fillna(0)
+            df[f"{prefix}_l{w}"] = (cs - lagged).to_numpy() / np.minimum(n_seen, w)
+
+    df["points_next"] = g[target].shift(-1)
+    df["is_latest"] = g["round"].shift(-1).isna()
+    df = df.drop(columns=values)
+    if with_target:
+        df = df[df["points_next"].notna()]
+    return df.reset_index(drop=True)
+
+def window_pipeline(player_ids=None, windows: Sequence[int] = WINDOWS,
+                    stats: Dict[str, str] = ROLLING_STATS, target: str = TARGET) -> list:
+    """
+    Server-side equivalent of build_features(with_target=False): computes the same
+    rolling columns with $setWindowFields and merges them into player_features.
+    """
+    output = {
+        "points_next": {"$shift": {"output": f"${target}", "by": 1}},
+        "next_round": {"$shift": {"output": "$round", "by": 1}},
+    }
+    for field, prefix in stats.items():
+        value = {"$convert": {"input": f"${field}", "to": "double", "onError": 0, "onNull": 0}}
+        for w in windows:
+            output[f"{prefix}_l{w}"] = {"$avg": value, "window": {"documents": [-(w - 1), 0]}}
+
+    match = {"player_id": {"$in": list(player_ids)}} if player_ids is not None else {}
+    return [
+        {"$match": match},
+        {"$setWindowFields": {"partitionBy": "$player_id", "sortBy": {"round": 1}, "output": output}},
+        {"$project": {
+            "_id": 0, "player_id": 1, "round": 1, "points_next": 1,
+            **{c: 1 for c in feature_columns(windows, stats)},
+            "is_latest": {"$eq": [{"$ifNull": ["$next_round", None]}, None]},
+            "updatedAt": "$$NOW",
+        }},
+        {"$merge": {"into": "player_features", "on": ["player_id", "round"],
+                    "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
@@ -0,0 +1,162 @@
+# fpl_http.py
+# HTTP layer for the FPL API: one keep-alive session, retries with backoff,
+# an on-disk cache revalidated with ETag/Last-Modified, and record/replay
+# of API snapshots for offline, deterministic runs.
+import os, json, time, random, hashlib, threading, requests
+from typing import Optional
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# Fetch tuning (element-summary calls are the bulk of a refresh)
+FETCH_WORKERS = int(os.getenv("FPL_FETCH_WORKERS", "8"))      # max in-flight requests
+FETCH_RATE    = float(os.getenv("FPL_FETCH_RATE", "10"))      # requests per second
+FETCH_RETRIES = int(os.getenv("FPL_FETCH_RETRIES", "4"))
+FETCH_BACKOFF = float(os.getenv("FPL_FETCH_BACKOFF", "0.5"))  # seconds, doubled per attempt
+FETCH_TIMEOUT = (5, float(os.getenv("FPL_FETCH_TIMEOUT", "15")))  # (connect, read)
+
+# live   - network, revalidating the on-disk cache when HTTP_CACHE=1 (default)
+# record - network, and every response is also saved to FPL_SNAPSHOT_DIR
+# replay - no network; responses come from FPL_SNAPSHOT_DIR only
+HTTP_MODE      = os.getenv("FPL_HTTP_MODE", "live")
+HTTP_CACHE     = os.getenv("FPL_HTTP_CACHE", "1") == "1"
+HTTP_CACHE_DIR = os.getenv("FPL_HTTP_CACHE_DIR", ".fpl_http_cache")
+SNAPSHOT_DIR   = os.getenv("FPL_SNAPSHOT_DIR", "fpl_snapshot")
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class ReplayMiss(LookupError):
+    """A URL was requested in replay mode but isn't in the snapshot."""
+
+class TokenBucket:
+    """Thread-safe token bucket: refills `rate` tokens per second, bursts up to `capacity`."""
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class ResponseStore:
+    """
+    Response bodies on disk, one <sha1(url)>.body file per URL plus a .meta.json
+    with the URL and its validators (ETag / Last-Modified).
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, url: str, ext: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(url.encode()).hexdigest() + ext)
+
+    def meta(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._path(url, ".meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def body(self, url: str) -> bytes:
+        with open(self._path(url, ".body"), "rb") as f:
+            return f.read()
+
+    def save(self, url: str, content: bytes, headers) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        meta = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                "saved_at": time.time()}
+        # Body first, then meta: a meta file always points at a complete body
+        for ext, data, mode in ((".body", content, "wb"), (".meta.json", json.dumps(meta), "w")):
+            path = self._path(url, ext)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+_session = None
+_session_lock = threading.Lock()
+
+def http_session():
+    """One keep-alive session per process, with a connection pool sized for FETCH_WORKERS."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, FETCH_WORKERS))
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update({"Accept-Encoding": "gzip, deflate", "Accept": "application/json"})
+            _session = s
+    return _session
+
+def _store() -> Optional[ResponseStore]:
+    if HTTP_MODE in ("record", "replay"):
+        return ResponseStore(SNAPSHOT_DIR)
+    return ResponseStore(HTTP_CACHE_DIR) if HTTP_CACHE else None
+
+def _retry_delay(attempt, response=None):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return min(30.0, FETCH_BACKOFF * 2 ** attempt) + random.uniform(0, FETCH_BACKOFF)
+
+def _conditional_headers(meta: Optional[dict]) -> dict:
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+def _endpoint(url: str) -> str:
+    """Metric label for a URL: its first API path segment (bootstrap-static, element-summary, ...)."""
+    parts = url.split("/api/", 1)[-1].split("/")
+    return parts[0] or "unknown"
+
+def fetch_json(url, bucket: TokenBucket = None, retries: int = FETCH_RETRIES):
+    with metrics.timed("fpl_fetch", endpoint=_endpoint(url), mode=HTTP_MODE):
+        return _fetch_json(url, bucket, retries)
+
+def _fetch_json(url, bucket: TokenBucket = None, retries: int = FETCH_RETRIES):
+    store = _store()
+    if HTTP_MODE == "replay":
+        if store.meta(url) is None:
+            raise ReplayMiss(f"{url} is not in the snapshot at {SNAPSHOT_DIR}")
+        return json.loads(store.body(url))
+
+    # Live mode revalidates cached copies; record mode always takes a fresh body
+    meta = store.meta(url) if store is not None and HTTP_MODE == "live" else None
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            r = http_session().get(url, headers=_conditional_headers(meta), timeout=FETCH_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            metrics.inc("fpl_fetch_retries_total", endpoint=_endpoint(url), status="network")
+            time.sleep(_retry_delay(attempt))
+            continue
+        if r.status_code in RETRY_STATUS and attempt < retries:
+            metrics.inc("fpl_fetch_retries_total", endpoint=_endpoint(url), status=r.status_code)
+            time.sleep(_retry_delay(attempt, r))
+            continue
+        if r.status_code == 304 and meta is not None:
+            metrics.inc("fpl_http_cache_total", result="revalidated")
+            return json.loads(store.body(url))
+        r.raise_for_status()
+        if store is not None and (HTTP_MODE == "record" or r.headers.get("ETag") or r.headers.get("Last-Modified")):
+            store.save(url, r.content, r.headers)
+        return r.json()
@@ -0,0 +1,123 @@
+# metrics.py
+# Lightweight in-process instrumentation: counters and timing summaries with
+# labels, emitted as structured JSON log lines and exported in Prometheus text format.
+import os, json, time, logging, tempfile, threading, functools
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+METRICS_LOG       = os.getenv("METRICS_LOG")                        # JSON-lines file (unset = logger only)
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "metrics.prom")  # Prometheus textfile export
+
+log = logging.getLogger("fpl.metrics")
+if METRICS_LOG and not log.handlers:
+    _handler = logging.FileHandler(METRICS_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+_lock = threading.Lock()
+_counters: Dict[tuple, float] = {}
+_timings: Dict[tuple, List[float]] = {}   # key -> [count, sum, max]
+
+def _key(name: str, labels: Dict[str, Any]) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+def emit(event: str, **fields):
+    """Writes one structured JSON log line."""
+    if log.isEnabledFor(logging.INFO):
+        log.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+def inc(name: str, value: float = 1, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+def observe(name: str, seconds: float, **labels):
+    k = _key(name, labels)
+    with _lock:
+        s = _timings.setdefault(k, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += seconds
+        s[2] = max(s[2], seconds)
+    emit(name, seconds=round(seconds, 6), **labels)
+
+@contextmanager
+def timed(name: str, **labels):
+    """Times the block into the `<name>_seconds` summary; failures get outcome=error."""
+    t0 = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe(f"{name}_seconds", time.perf_counter() - t0, outcome=outcome, **labels)
+
+def timed_fn(name: str, **labels):
+    """Decorator form of timed(), labelled with the function name."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with timed(name, fn=fn.__name__, **labels):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def snapshot() -> List[Dict[str, Any]]:
+    """Current values as rows (for the diagnostics panel)."""
+    with _lock:
+        rows = [{"metric": n, **dict(l), "type": "counter", "value": v} for (n, l), v in _counters.items()]
+        rows += [{"metric": n, **dict(l), "type": "timing", "count": c, "sum_s": round(s, 6),
+                  "avg_ms": round(s / c * 1000, 3) if c else 0.0, "max_ms": round(m * 1000, 3)}
+                 for (n, l), (c, s, m) in _timings.items()]
+    return sorted(rows, key=lambda r: r["metric"])
+
+def _fmt_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def prometheus_text() -> str:
+    lines = []
+    with _lock:
+        for name in sorted({n for n, _ in _counters}):
+            lines.append(f"# TYPE fpl_{name} counter")
+            lines += [f"fpl_{name}{_fmt_labels(l)} {v}" for (n, l), v in _counters.items() if n == name]
+        for name in sorted({n for n, _ in _timings}):
+            lines.append(f"# TYPE fpl_{name} summary")
+            for (n, l), (c, s, m) in _timings.items():
+                if n == name:
+                    lines.append(f"fpl_{name}_count{_fmt_labels(l)} {c}")
+                    lines.append(f"fpl_{name}_sum{_fmt_labels(l)} {s:.6f}")
+                    lines.append(f"fpl_{name}_max{_fmt_labels(l)} {m:.6f}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str = None) -> Optional[str]:
+    """
+    Atomically writes the Prometheus text export (node_exporter textfile style).
+    Called from finally blocks, so a failed export is logged, never raised.
+    """
+    path = path or METRICS_PROM_FILE
+    tmp = None
+    try:
+        # Unique temp file per writer; concurrent callers never share one
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, "w") as f:
+            f.write(prometheus_text())
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600; the exporter may run as another user
+        os.replace(tmp, path)
+        return path
+    except OSError as e:
+        log.warning("metrics export to %s failed: %r", path, e)
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
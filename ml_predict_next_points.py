@@ -1,69 +1,192 @@
-import os, numpy as np, pandas as pd
-from pymongo import MongoClient
+import os, glob, argparse, datetime, tempfile, threading, joblib, numpy as np, pandas as pd
 from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+from mongo_conn import get_db, close_client, get_data_version
+import parquet_export
 from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.linear_model import Ridge
+from features import build_features, feature_columns, history_fields
 
 load_dotenv()
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("DB_NAME","fpl")]
-
-rows = []
-cursor = db.player_history.aggregate([{"$sort": {"player_id":1, "round":1}}])
-per_player = {}
-for h in cursor:
-    pid = h["player_id"]
-    per_player.setdefault(pid, []).append(h)
-
-for pid, hist in per_player.items():
-    hist = sorted(hist, key=lambda r: r["round"])
-    for i in range(len(hist)-1):
-        prev4 = hist[max(0, i-3):i+1]
-        mean_xgi = np.mean([r.get("expected_goal_involvements", 0) for r in prev4])
-        mean_mins = np.mean([r.get("minutes", 0) for r in prev4])
-        next_points = hist[i+1].get("total_points")
-        if next_points is None: continue
-        rows.append({"player_id": pid, "round": hist[i]["round"],
-                     "xgi_l4": mean_xgi, "mins_l4": mean_mins,
-                     "points_next": next_points})
-
-train_hist = pd.DataFrame(rows)
-if train_hist.empty:
-    raise SystemExit("Not enough history — rerun ETL or raise max_players.")
-
-snap_cols = ["id","element_type","now_cost","minutes",
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+MODEL_KEEP = int(os.getenv("MODEL_KEEP", "3"))  # artifacts kept per MODEL_DIR (newest first)
+
+snap_cols = ["id","web_name","team","element_type","now_cost","minutes",
              "expected_goals_per_90","expected_assists_per_90",
              "expected_goal_involvements_per_90",
              "chance_of_playing_next_round","status"]
-snap = pd.DataFrame(list(db.player_snapshots.find({}, {c:1 for c in snap_cols})))
-train = train_hist.merge(snap, left_on="player_id", right_on="id", how="left")
-
-y = train["points_next"].values
-X = train[["xgi_l4","mins_l4",
-           "expected_goal_involvements_per_90","expected_goals_per_90","expected_assists_per_90",
-           "now_cost","element_type","status","chance_of_playing_next_round"]]
 
-num = ["xgi_l4","mins_l4","expected_goal_involvements_per_90","expected_goals_per_90",
-       "expected_assists_per_90","now_cost","chance_of_playing_next_round"]
+rolling = feature_columns()
+num = rolling + ["expected_goal_involvements_per_90","expected_goals_per_90",
+                 "expected_assists_per_90","now_cost","chance_of_playing_next_round"]
 cat = ["element_type","status"]
 
-ct = ColumnTransformer([("num", StandardScaler(), num),
-                        ("cat", OneHotEncoder(handle_unknown="ignore"), cat)])
-
-Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.25, random_state=42)
-Xtr_t = ct.fit_transform(Xtr); Xte_t = ct.transform(Xte)
-model = Ridge(alpha=1.0).fit(Xtr_t, ytr)
-print("Model R^2 (test):", model.score(Xte_t, yte))
-
-pred_all = snap.copy()
-pred_all["xgi_l4"] = pred_all["expected_goal_involvements_per_90"].fillna(0)
-pred_all["mins_l4"] = np.minimum(90, pred_all["minutes"].fillna(0)/10.0)
-pred_X = pred_all[["xgi_l4","mins_l4",
-                   "expected_goal_involvements_per_90","expected_goals_per_90","expected_assists_per_90",
-                   "now_cost","element_type","status","chance_of_playing_next_round"]]
-pred_all["pred_next_points"] = model.predict(ct.transform(pred_X))
-print(pred_all.sort_values("pred_next_points", ascending=False)
-      [["id","element_type","now_cost","pred_next_points"]].head(20))
-client.close()
+def load_history(db) -> pd.DataFrame:
+    fields = history_fields()
+    return pd.DataFrame(list(db.player_history.find({}, {"_id": 0, **{f: 1 for f in fields}})))
+
+def parquet_training_data(version):
+    """
+    (history, snapshots) from the Parquet export when it was written for
+    `version`, else None. Reads are columnar and memory-mapped; no Mongo needed.
+    """
+    info = parquet_export.manifest()
+    if not info or info.get("data_version") != version:
+        return None
+    hist = parquet_export.read_history(history_fields())
+    snap = parquet_export.read_snapshot(snap_cols)
+    if hist.empty or snap.empty:
+        return None
+    snap["chance_of_playing_next_round"] = snap["chance_of_playing_next_round"].fillna(100)
+    return hist, snap
+
+def training_version(db):
+    """Current data version; the Parquet export's when Mongo can't be reached."""
+    try:
+        return get_data_version(db)
+    except PyMongoError as e:
+        version = parquet_export.manifest().get("data_version")
+        if version is None:
+            raise
+        print(f"Mongo unavailable ({type(e).__name__}); training from the Parquet export")
+        return version
+
+def load_features(db, latest: bool = False) -> pd.DataFrame:
+    """
+    Ready-made rows from the player_features store: training rows (with a
+    next-round target) or, with latest=True, each player's most recent round.
+    Empty if the store is missing or was built with other window settings.
+    """
+    query = {"is_latest": True} if latest else {"points_next": {"$ne": None}}
+    fields = ["player_id", "round", "points_next", *rolling]
+    df = pd.DataFrame(list(db.player_features.find(query, {"_id": 0, **{f: 1 for f in fields}})))
+    return df if set(fields) <= set(df.columns) else pd.DataFrame()
+
+def live_frame(db, snap: pd.DataFrame) -> pd.DataFrame:
+    """Snapshot rows joined to each player's latest stored rolling features."""
+    latest = load_features(db, latest=True)
+    if latest.empty:
+        latest = pd.DataFrame(columns=["player_id", *rolling])
+    pred_all = snap.merge(latest[["player_id", *rolling]], left_on="id", right_on="player_id", how="left")
+    # Players without stored history: approximate from season per-90 numbers
+    for c in feature_columns(stats={"expected_goal_involvements": "xgi"}):
+        pred_all[c] = pred_all[c].fillna(pred_all["expected_goal_involvements_per_90"])
+    for c in feature_columns(stats={"minutes": "mins"}):
+        pred_all[c] = pred_all[c].fillna(np.minimum(90, pred_all["minutes"].fillna(0)/10.0))
+    pred_all[rolling] = pred_all[rolling].astype(float).fillna(0)
+    return pred_all.drop(columns=["player_id"])
+
+def load_snapshots(db) -> pd.DataFrame:
+    snap = pd.DataFrame(list(db.player_snapshots.find({}, {"_id": 0, **{c: 1 for c in snap_cols}})))
+    snap = snap.reindex(columns=snap_cols)
+    # FPL leaves chance_of_playing_next_round null for fully fit players
+    snap["chance_of_playing_next_round"] = snap["chance_of_playing_next_round"].fillna(100)
+    return snap
+
+def train(train):
+    y = train["points_next"].values
+    X = train[num + cat]
+    ct = ColumnTransformer([("num", StandardScaler(), num),
+                            ("cat", OneHotEncoder(handle_unknown="ignore"), cat)])
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.25, random_state=42)
+    Xtr_t = ct.fit_transform(Xtr); Xte_t = ct.transform(Xte)
+    model = Ridge(alpha=1.0).fit(Xtr_t, ytr)
+    print("Model R^2 (test):", model.score(Xte_t, yte))
+    return ct, model
+
+# --- Model artifacts ---
+def artifact_path(version) -> str:
+    return os.path.join(MODEL_DIR, f"next_points-{version or 'unversioned'}.joblib")
+
+def save_model(ct, model, version) -> str:
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = artifact_path(version)
+    # Unique temp file, so concurrent writers (threads or processes) never share one
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=MODEL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump({"ct": ct, "model": model, "data_version": version, "num": num, "cat": cat,
+                         "trained_at": datetime.datetime.utcnow().isoformat()}, f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    prune_models(keep=path)
+    return path
+
+def prune_models(keep: str = None, n: int = MODEL_KEEP):
+    """Deletes all but the newest `n` artifacts (never `keep`)."""
+    paths = sorted(glob.glob(os.path.join(MODEL_DIR, "next_points-*.joblib")), key=os.path.getmtime, reverse=True)
+    for path in paths[max(1, n):]:
+        if keep is None or os.path.abspath(path) != os.path.abspath(keep):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already pruned by another process
+
+def load_model(version):
+    """Artifact trained on `version`, or None if there isn't one yet."""
+    path = artifact_path(version)
+    return joblib.load(path) if os.path.exists(path) else None
+
+_train_lock = threading.Lock()
+
+def ensure_model(db, force: bool = False):
+    """Loads the artifact for the current data version, training one only if it's missing."""
+    version = training_version(db)
+    artifact = None if force else load_model(version)
+    if artifact is not None:
+        return artifact
+    with _train_lock:
+        # Another thread may have trained this version while we waited
+        artifact = None if force else load_model(version)
+        if artifact is None:
+            artifact = _train_and_save(db, version)
+    return artifact
+
+def _train_and_save(db, version):
+    """Trains on `version` (Parquet export if it matches, else Mongo) and saves the artifact."""
+    exported = parquet_training_data(version)
+    if exported is not None:
+        hist, snap = exported
+        train_hist = build_features(hist)
+    else:
+        train_hist = load_features(db)
+        if train_hist.empty:
+            hist = load_history(db)
+            train_hist = build_features(hist) if not hist.empty else pd.DataFrame()
+        snap = load_snapshots(db) if not train_hist.empty else None
+    if train_hist.empty:
+        raise RuntimeError("Not enough history — rerun ETL or raise max_players.")
+    ct, model = train(train_hist.merge(snap, left_on="player_id", right_on="id", how="left"))
+    print("Saved model:", save_model(ct, model, version))
+    return load_model(version)
+
+def predict_all(db, artifact) -> pd.DataFrame:
+    """Predicted next-GW points for every player in player_snapshots."""
+    pred_all = live_frame(db, load_snapshots(db))
+    X = pred_all[artifact["num"] + artifact["cat"]]
+    pred_all["pred_next_points"] = artifact["model"].predict(artifact["ct"].transform(X))
+    return pred_all
+
+def main():
+    ap = argparse.ArgumentParser(description="Train (if needed) and print next-GW points predictions.")
+    ap.add_argument("--force", action="store_true", help="retrain even if an artifact exists for this data version")
+    args = ap.parse_args()
+
+    db = get_db()
+    try:
+        artifact = ensure_model(db, force=args.force)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    pred_all = predict_all(db, artifact)
+    print(f"Model for data_version={artifact['data_version']} (trained {artifact['trained_at']})")
+    print(pred_all.sort_values("pred_next_points", ascending=False)
+          [["id","web_name","element_type","now_cost","pred_next_points"]].head(20))
+    close_client()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# mongo_conn.py
+# Process-wide MongoDB connection manager shared by the ETL, agent tools, app and scripts.
+import os, time, threading
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME   = os.getenv("DB_NAME", "fpl")
+
+# Pool / timeout settings (all overridable from the environment)
+POOL_OPTIONS = {
+    "maxPoolSize":              int(os.getenv("MONGO_MAX_POOL_SIZE", "20")),
+    "minPoolSize":              int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    "maxIdleTimeMS":            int(os.getenv("MONGO_MAX_IDLE_MS", "300000")),
+    "waitQueueTimeoutMS":       int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+    "connectTimeoutMS":         int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+    # Finite, so a hung server can't block a caller forever (0 = no timeout)
+    "socketTimeoutMS":          int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "300000")) or None,
+    "readPreference":           os.getenv("MONGO_READ_PREFERENCE", "primary"),
+}
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Collects connection-pool counters from pymongo's CMAP events."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.pool_clears = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open_connections": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+                "pool_clears": self.pool_clears,
+                "max_pool_size": POOL_OPTIONS["maxPoolSize"],
+            }
+
+    # Checkout happens synchronously on the calling thread, so a thread-local
+    # start time is enough to measure how long each checkout waited.
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = (time.perf_counter() - getattr(self._local, "started", time.perf_counter())) * 1000
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_ms_total += waited
+            self.wait_ms_max = max(self.wait_ms_max, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+
+_stats = PoolStats()
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+def get_client(**overrides) -> MongoClient:
+    """
+    Returns the shared MongoClient, creating it on first use.
+    `overrides` (e.g. tlsCAFile) only apply to that first call.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                opts = {k: v for k, v in POOL_OPTIONS.items() if v is not None}
+                opts.update(overrides)
+                _client = MongoClient(MONGO_URI, event_listeners=[_stats], **opts)
+    return _client
+
+def get_db(name: Optional[str] = None):
+    return get_client()[name or DB_NAME]
+
+def pool_stats() -> Dict[str, Any]:
+    return _stats.snapshot()
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+# --- Data version marker ---
+# The ETL bumps meta.data_version after every successful load; in-process caches
+# compare against it to know when their copy of the data is stale.
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "5"))  # seconds between marker reads
+_version_cache = {"value": None, "read_at": 0.0}
+
+def get_data_version(db=None) -> Optional[str]:
+    doc = (db if db is not None else get_db()).meta.find_one({"_id": "data_version"}, {"version": 1})
+    return doc["version"] if doc else None
+
+def bump_data_version(db=None) -> str:
+    import datetime, uuid
+    now = datetime.datetime.utcnow()
+    version = now.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+    (db if db is not None else get_db()).meta.update_one(
+        {"_id": "data_version"}, {"$set": {"version": version, "updatedAt": now}}, upsert=True
+    )
+    _version_cache.update(value=version, read_at=time.monotonic())
+    return version
+
+def data_version(max_age: float = DATA_VERSION_TTL) -> Optional[str]:
+    """Current data version, re-read from Mongo at most every `max_age` seconds."""
+    now = time.monotonic()
+    if now - _version_cache["read_at"] >= max_age:
+        _version_cache.update(value=get_data_version(), read_at=now)
+    return _version_cache["value"]
+
+def set_client(client) -> None:
+    """Use an existing client (e.g. a local stand-in for benchmarks) as the shared one."""
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,92 @@
+# name_index.py
+# Player-name resolution: accent-folded search keys plus an in-memory
+# token/prefix/trigram index that ranks candidates by match quality.
+import re, unicodedata
+from typing import Dict, List, Iterable, Optional
+
+# Letters NFKD doesn't decompose into ASCII
+_FOLD = str.maketrans({"ø": "o", "ß": "ss", "æ": "ae", "œ": "oe", "ł": "l", "đ": "d", "ð": "d", "þ": "th", "ı": "i"})
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize_name(s: Optional[str]) -> str:
+    """'Ødegaard' -> 'odegaard', 'Heung-Min Son' -> 'heung min son'."""
+    s = unicodedata.normalize("NFKD", (s or "").casefold().translate(_FOLD))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", s).strip()
+
+def search_keys(p: dict) -> Dict[str, str]:
+    """Search fields stored on player_snapshots by the ETL."""
+    return {
+        "search_name": normalize_name(p.get("web_name")),
+        "search_full": normalize_name(f"{p.get('first_name', '')} {p.get('second_name', '')}"),
+    }
+
+def _trigrams(s: str) -> set:
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+class NameIndex:
+    """
+    Ranks players for a free-text name. Scores, best first:
+    exact web name (100), exact full name (90), whole-word match (80),
+    web-name prefix (70), word prefix (60), then trigram similarity (< 50).
+    Ties go to the player with more minutes, then the lower id.
+    """
+    def __init__(self, players: Iterable[dict]):
+        self.players: Dict[int, dict] = {}
+        self.exact: Dict[str, set] = {}
+        self.words: Dict[str, set] = {}
+        self.prefixes: Dict[str, set] = {}
+        self.grams: Dict[str, set] = {}
+        for p in players:
+            if not p.get("search_name"):
+                p = {**p, **search_keys(p)}
+            pid = p["id"]
+            self.players[pid] = p
+            for key in (p["search_name"], p["search_full"]):
+                self.exact.setdefault(key, set()).add(pid)
+                for g in _trigrams(key):
+                    self.grams.setdefault(g, set()).add(pid)
+            for word in set(p["search_name"].split()) | set(p["search_full"].split()):
+                self.words.setdefault(word, set()).add(pid)
+                for i in range(1, len(word) + 1):
+                    self.prefixes.setdefault(word[:i], set()).add(pid)
+
+    def _score(self, q: str, p: dict, q_grams: set) -> float:
+        name, full = p["search_name"], p["search_full"]
+        if q == name:
+            return 100
+        if q == full:
+            return 90
+        if f" {q} " in f" {name} " or f" {q} " in f" {full} ":
+            return 80
+        if name.startswith(q):
+            return 70
+        if any(w.startswith(q) for w in name.split() + full.split()):
+            return 60
+        sim = max(len(q_grams & _trigrams(k)) / len(q_grams | _trigrams(k)) for k in (name, full))
+        return 50 * sim
+
+    def search(self, query: str, limit: int = 5, min_score: float = 15) -> List[dict]:
+        q = normalize_name(query)
+        if not q:
+            return []
+        q_grams = _trigrams(q)
+        cands = set(self.exact.get(q, ())) | self.prefixes.get(q, set())
+        for word in q.split():
+            cands |= self.words.get(word, set())
+        if not cands:
+            for g in q_grams:
+                cands |= self.grams.get(g, set())
+        ranked = []
+        for pid in cands:
+            p = self.players[pid]
+            score = self._score(q, p, q_grams)
+            if score >= min_score:
+                ranked.append((-score, -(p.get("minutes") or 0), pid))
+        ranked.sort()
+        return [{**self.players[pid], "score": round(-s, 1)} for s, _, pid in ranked[:limit]]
+
+    def best(self, query: str) -> Optional[dict]:
+        hits = self.search(query, limit=1)
+        return hits[0] if hits else None
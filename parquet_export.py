@@ -0,0 +1,153 @@
+# parquet_export.py
+# Typed, columnar copy of player_history and player_snapshots for model training,
+# partitioned hive-style by season and gameweek:
+#   <PARQUET_DIR>/player_history/season=2025-26/gameweek=7/part-0.parquet
+#   <PARQUET_DIR>/player_snapshots/season=2025-26/gameweek=7/part-0.parquet
+# History partitions are written once, when a gameweek is finished and data-checked;
+# the snapshot partition of the current gameweek is replaced on every export.
+import os, json, shutil, datetime
+from typing import List, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from features import ROLLING_STATS
+import snapshot_history
+
+load_dotenv()
+
+PARQUET_DIR = os.getenv("PARQUET_DIR", "parquet")
+SEASON = os.getenv("FPL_SEASON")  # e.g. "2025-26"; default: derived from the GW1 deadline
+MANIFEST = "_manifest.json"
+
+HISTORY_SCHEMA = pa.schema([
+    ("player_id", pa.int32()), ("round", pa.int16()), ("fixture", pa.int32()),
+    ("opponent_team", pa.int16()), ("was_home", pa.bool_()), ("minutes", pa.int16()),
+    ("total_points", pa.int16()), ("goals_scored", pa.int16()), ("assists", pa.int16()),
+    ("bps", pa.int16()), ("expected_goals", pa.float32()), ("expected_assists", pa.float32()),
+    ("expected_goal_involvements", pa.float32()), ("value", pa.int16()), ("selected", pa.int64()),
+])
+# Extra rolling stats (FEATURE_EXTRA_STATS) are exported too
+HISTORY_SCHEMA = pa.schema(list(HISTORY_SCHEMA) + [
+    (s, pa.float32()) for s in ROLLING_STATS if s not in HISTORY_SCHEMA.names
+])
+
+SNAPSHOT_SCHEMA = pa.schema([
+    ("id", pa.int32()), ("web_name", pa.string()), ("team", pa.int16()), ("element_type", pa.int8()),
+    ("now_cost", pa.int16()), ("minutes", pa.int32()), ("status", pa.string()),
+    ("chance_of_playing_next_round", pa.float32()), ("expected_goals_per_90", pa.float32()),
+    ("expected_assists_per_90", pa.float32()), ("expected_goal_involvements_per_90", pa.float32()),
+])
+
+def season_label(db) -> str:
+    """FPL_SEASON, else e.g. '2025-26' from the first gameweek's deadline."""
+    if SEASON:
+        return SEASON
+    gw1 = db.events.find_one({}, {"deadline_time": 1}, sort=[("id", 1)])
+    year = int(gw1["deadline_time"][:4]) if gw1 and gw1.get("deadline_time") else datetime.date.today().year
+    return f"{year}-{(year + 1) % 100:02d}"
+
+def _partition(table: str, season: str, gameweek: int, root: str = PARQUET_DIR) -> str:
+    return os.path.join(root, table, f"season={season}", f"gameweek={gameweek}")
+
+def _typed(rows: List[dict], schema: pa.Schema) -> pa.Table:
+    df = pd.DataFrame(rows).reindex(columns=schema.names)
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce").astype("Int64")
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce")
+        elif pa.types.is_boolean(field.type):
+            df[field.name] = df[field.name].astype("boolean")
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False).replace_schema_metadata(None)
+
+def _write_partition(table: pa.Table, path: str):
+    """Writes a partition directory atomically (temp dir + rename)."""
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    pq.write_table(table, os.path.join(tmp, "part-0.parquet"), compression="zstd")
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+def exported_gameweeks(season: str, table: str = "player_history", root: str = PARQUET_DIR) -> set:
+    base = os.path.join(root, table, f"season={season}")
+    if not os.path.isdir(base):
+        return set()
+    return {int(d.split("=", 1)[1]) for d in os.listdir(base)
+            if d.startswith("gameweek=") and not d.endswith(".tmp")}
+
+def export(db, data_version: Optional[str] = None, rebuild: bool = False, root: str = PARQUET_DIR) -> dict:
+    """
+    Appends history for newly finished gameweeks and replaces the current
+    snapshot partition. `rebuild` rewrites every history partition (use it after
+    a full ETL, e.g. when max_players grew and old gameweeks gained players).
+    """
+    season = season_label(db)
+    checked = [e["id"] for e in db.events.find({"finished": True, "data_checked": True}, {"id": 1})]
+    done = set() if rebuild else exported_gameweeks(season, root=root)
+    todo = sorted(set(checked) - done)
+
+    written = 0
+    if todo:
+        projection = {"_id": 0, **{f: 1 for f in HISTORY_SCHEMA.names}}
+        rows = pd.DataFrame(list(db.player_history.find({"round": {"$in": todo}}, projection)))
+        for gw in todo:
+            part = rows[rows["round"] == gw] if not rows.empty else rows
+            if part.empty:
+                continue
+            _write_partition(_typed(part.to_dict("records"), HISTORY_SCHEMA),
+                             _partition("player_history", season, gw, root))
+            written += len(part)
+
+    events = list(db.events.find({}, {"_id": 0, "id": 1, "is_current": 1, "finished": 1}))
+    event = snapshot_history.current_event(events)
+    snaps = list(db.player_snapshots.find({}, {"_id": 0, **{f: 1 for f in SNAPSHOT_SCHEMA.names}}))
+    if snaps:
+        _write_partition(_typed(snaps, SNAPSHOT_SCHEMA), _partition("player_snapshots", season, event, root))
+
+    info = {"data_version": data_version, "season": season, "snapshot_gameweek": event,
+            "history_gameweeks": sorted(exported_gameweeks(season, root=root)),
+            "exported_at": datetime.datetime.utcnow().isoformat()}
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, MANIFEST + ".tmp"), "w") as f:
+        json.dump(info, f)
+    os.replace(os.path.join(root, MANIFEST + ".tmp"), os.path.join(root, MANIFEST))
+    print(f"Parquet: +{len(todo)} gameweeks ({written} history rows), snapshot GW{event} ({len(snaps)} players)")
+    return info
+
+def manifest(root: str = PARQUET_DIR) -> dict:
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def read_history(columns: Optional[List[str]] = None, season: Optional[str] = None,
+                 root: str = PARQUET_DIR) -> pd.DataFrame:
+    """
+    Exported history of one season (default: the manifest's), memory-mapped;
+    empty if nothing was exported. FPL reuses player ids across seasons, so
+    seasons are never mixed.
+    """
+    season = season or manifest(root).get("season")
+    base = os.path.join(root, "player_history", f"season={season}")
+    if not season or not os.path.isdir(base):
+        return pd.DataFrame()
+    files = sorted(os.path.join(d, f) for d, _, fs in os.walk(base) if not d.endswith(".tmp")
+                   for f in fs if f.endswith(".parquet"))
+    if not files:
+        return pd.DataFrame()
+    tables = [pq.read_table(f, columns=columns, memory_map=True) for f in files]
+    return pa.concat_tables(tables).to_pandas()
+
+def read_snapshot(columns: Optional[List[str]] = None, root: str = PARQUET_DIR) -> pd.DataFrame:
+    """The most recently exported snapshot partition (memory-mapped)."""
+    info = manifest(root)
+    if not info:
+        return pd.DataFrame()
+    path = os.path.join(_partition("player_snapshots", info["season"], info["snapshot_gameweek"], root),
+                        "part-0.parquet")
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
@@ -0,0 +1,115 @@
+# projections.py
+# Fixture-aware expected-points projection over the next N gameweeks.
+# Builds team x gameweek matrices from fixtures + teams, then projects every
+# player in one vectorised NumPy pass.
+from typing import Dict, Any, List, Optional
+import numpy as np
+
+# FPL scoring by element_type (1 GK, 2 DEF, 3 MID, 4 FWD); index 0 unused
+GOAL_PTS   = np.array([0, 6, 6, 5, 4], dtype=float)
+CS_PTS     = np.array([0, 4, 4, 1, 0], dtype=float)
+ASSIST_PTS = 3.0
+APPEAR_PTS = 2.0
+# Fallbacks from the fixture difficulty rating when team strengths are missing
+FDR_ATTACK = {1: 1.3, 2: 1.15, 3: 1.0, 4: 0.85, 5: 0.7}
+FDR_CS     = {1: 0.55, 2: 0.45, 3: 0.33, 4: 0.22, 5: 0.12}
+BASE_CS    = 0.3
+
+def fixture_matrices(fixtures: List[dict], teams: List[dict], start_event: int, horizon: int) -> Dict[str, np.ndarray]:
+    """
+    Team x gameweek matrices (row = team id) for events start_event..start_event+horizon-1:
+      n      - fixtures played (0 blank, 2 double)
+      attack - summed attacking multiplier vs each opponent's defence (1.0 = average)
+      cs     - summed clean-sheet probability vs each opponent's attack
+    """
+    size = max([t["id"] for t in teams] + [0]) + 1
+    n = np.zeros((size, horizon))
+    attack = np.zeros((size, horizon))
+    cs = np.zeros((size, horizon))
+
+    strength = {t["id"]: t for t in teams}
+    keys = ("strength_attack_home", "strength_attack_away", "strength_defence_home", "strength_defence_away")
+    have_strength = teams and all(t.get(k) for t in teams for k in keys)
+    if have_strength:
+        mean_att = np.mean([t[k] for t in teams for k in keys[:2]])
+        mean_def = np.mean([t[k] for t in teams for k in keys[2:]])
+
+    for f in fixtures:
+        g = (f.get("event") or 0) - start_event
+        if not 0 <= g < horizon:
+            continue
+        for team, opp, side, opp_side, fdr in ((f["team_h"], f["team_a"], "home", "away", f.get("team_h_difficulty")),
+                                               (f["team_a"], f["team_h"], "away", "home", f.get("team_a_difficulty"))):
+            n[team, g] += 1
+            if have_strength:
+                attack[team, g] += mean_def / strength[opp][f"strength_defence_{opp_side}"]
+                cs[team, g] += np.clip(BASE_CS * mean_att / strength[opp][f"strength_attack_{opp_side}"], 0.02, 0.8)
+            else:
+                attack[team, g] += FDR_ATTACK.get(fdr, 1.0)
+                cs[team, g] += FDR_CS.get(fdr, BASE_CS)
+    return {"n": n, "attack": attack, "cs": cs}
+
+def project(cols: Dict[str, np.ndarray], mats: Dict[str, np.ndarray], games_played: int) -> np.ndarray:
+    """
+    Expected points, shape (players, horizon). `cols` are the snapshot columns from
+    SnapshotCache (team, element_type, minutes, chance, xg90, xa90).
+    """
+    team = np.nan_to_num(cols["team"]).astype(int)
+    team = np.where(team < mats["n"].shape[0], team, 0)   # unknown teams -> row 0 (no fixtures)
+    pos = np.clip(np.nan_to_num(cols["element_type"]).astype(int), 0, 4)
+    # Share of available minutes played so far stands in for P(plays)
+    p_play = np.clip(np.nan_to_num(cols["minutes"]) / (90.0 * max(1, games_played)), 0, 1)
+    chance = cols["chance"]
+    avail = np.where(np.isnan(chance), 1.0, chance / 100)
+    xg90, xa90 = np.nan_to_num(cols["xg90"]), np.nan_to_num(cols["xa90"])
+
+    per_attack = p_play * (xg90 * GOAL_PTS[pos] + xa90 * ASSIST_PTS)   # points per unit attack multiplier
+    per_cs = p_play * CS_PTS[pos]
+    ep = (APPEAR_PTS * p_play)[:, None] * mats["n"][team] \
+        + per_attack[:, None] * mats["attack"][team] \
+        + per_cs[:, None] * mats["cs"][team]
+    return avail[:, None] * ep
+
+class ProjectionEngine:
+    """Fixture matrices for one data version; projections are recomputed per call (one NumPy pass)."""
+    MAX_HORIZON = 10
+
+    def __init__(self, db):
+        events = list(db.events.find({}, {"_id": 0, "id": 1, "finished": 1, "is_next": 1}))
+        nxt = [e["id"] for e in events if e.get("is_next")]
+        self.games_played = sum(1 for e in events if e.get("finished"))
+        self.start_event = nxt[0] if nxt else self.games_played + 1
+        fixtures = list(db.fixtures.find(
+            {"event": {"$gte": self.start_event, "$lt": self.start_event + self.MAX_HORIZON}},
+            {"_id": 0, "event": 1, "team_h": 1, "team_a": 1, "team_h_difficulty": 1, "team_a_difficulty": 1}))
+        teams = list(db.teams.find({}, {"_id": 0}))
+        self.mats = fixture_matrices(fixtures, teams, self.start_event, self.MAX_HORIZON)
+        self.team_names = {t["id"]: t.get("short_name") for t in teams}
+
+    def projection(self, cols: Dict[str, np.ndarray], horizon: int) -> np.ndarray:
+        h = max(1, min(int(horizon), self.MAX_HORIZON))
+        return project(cols, {k: m[:, :h] for k, m in self.mats.items()}, self.games_played)
+
+    def top(self, cols: Dict[str, np.ndarray], horizon: int = 5, element_type: Optional[int] = None,
+            limit: int = 10, max_price: Optional[float] = None, min_minutes: int = 0) -> List[Dict[str, Any]]:
+        ep = self.projection(cols, horizon)
+        total = ep.sum(axis=1)
+        mask = np.nan_to_num(cols["minutes"]) >= int(min_minutes)
+        if element_type is not None:
+            mask &= cols["element_type"] == element_type
+        if max_price is not None:
+            mask &= cols["price_m"] <= float(max_price)
+        idx = np.flatnonzero(mask)
+        k = min(int(limit), len(idx))
+        if 0 < k < len(idx):
+            idx = idx[np.argpartition(-total[idx], k - 1)[:k]]
+        idx = idx[np.argsort(-total[idx], kind="stable")][:k]
+        return [{
+            "id": int(cols["id"][i]),
+            "web_name": cols["web_name"][i],
+            "element_type": int(cols["element_type"][i]),
+            "team": self.team_names.get(int(cols["team"][i]), int(cols["team"][i])),
+            "price_m": float(cols["price_m"][i]),
+            "xpts_total": round(float(total[i]), 2),
+            "xpts_by_gw": {str(self.start_event + g): round(float(v), 2) for g, v in enumerate(ep[i])},
+        } for i in idx]
@@ -1,10 +1,8 @@
-import os
-from pymongo import MongoClient
 from dotenv import load_dotenv
+from mongo_conn import get_db, pool_stats, close_client
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("DB_NAME","fpl")]
+db = get_db()
 
 pipeline = [
   {"$match": {"minutes": {"$gte": 300}}},
@@ -26,4 +24,5 @@ for r in recent:
            "xG": r.get("expected_goals"), "xA": r.get("expected_assists"),
            "xGI": r.get("expected_goal_involvements")})
 
-client.close()
+print("\nPool stats:", pool_stats())
+close_client()
@@ -0,0 +1,101 @@
+# refresh_jobs.py
+# Runs the ETL in-process on a background thread so the app and agent can
+# start a refresh, poll its progress and cancel it without blocking.
+import time, uuid, threading
+from typing import Dict, Any, Optional
+import etl_fpl_to_mongo as etl
+
+MAX_JOBS_KEPT = 20
+
+class RefreshJob:
+    def __init__(self, max_players: Optional[int], full: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.max_players = max_players
+        self.full = full
+        self.status = "running"        # running | done | failed | cancelled
+        self.stage = "queued"
+        self.done = 0
+        self.total = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def update(self, stage: str, done: Optional[int] = None, total: Optional[int] = None):
+        self.stage = stage
+        if total is not None:
+            self.done, self.total = done or 0, total
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "players_done": self.done,
+            "players_total": self.total,
+            "elapsed_s": round(end - self.started_at, 1),
+            "max_players": self.max_players,
+            "full": self.full,
+            "result": self.result,
+            "error": self.error,
+        }
+
+_lock = threading.Lock()
+_jobs: Dict[str, RefreshJob] = {}
+_current: Optional[RefreshJob] = None
+
+def _run(job: RefreshJob):
+    global _current
+    try:
+        job.result = etl.run_etl(max_players=job.max_players, full=job.full,
+                                 progress=job.update, cancel=job.cancel_event)
+        job.status = "done"
+    except etl.Cancelled as e:
+        job.status, job.error = "cancelled", str(e)
+    except Exception as e:
+        job.status, job.error = "failed", repr(e)
+    finally:
+        job.finished_at = time.time()
+        with _lock:
+            if _current is job:
+                _current = None
+
+def start_refresh(max_players: Optional[int] = None, full: bool = False) -> Dict[str, Any]:
+    """Starts a background refresh, or returns the one already running."""
+    global _current
+    with _lock:
+        if _current is not None:
+            return {**_current.to_dict(), "already_running": True}
+        job = RefreshJob(max_players, full)
+        _jobs[job.id] = job
+        for old in list(_jobs)[:-MAX_JOBS_KEPT]:
+            _jobs.pop(old)
+        _current = job
+    threading.Thread(target=_run, args=(job,), name=f"refresh-{job.id}", daemon=True).start()
+    return job.to_dict()
+
+def _find(job_id: Optional[str]) -> Optional[RefreshJob]:
+    with _lock:
+        if job_id:
+            return _jobs.get(job_id)
+        return _current or (list(_jobs.values())[-1] if _jobs else None)
+
+def job_status(job_id: Optional[str] = None) -> Dict[str, Any]:
+    """Status of `job_id`, or of the running / most recent job."""
+    job = _find(job_id)
+    if job is None:
+        return {"error": f"No refresh job '{job_id}'" if job_id else "No refresh has been started"}
+    return job.to_dict()
+
+def cancel_refresh(job_id: Optional[str] = None) -> Dict[str, Any]:
+    job = _find(job_id)
+    if job is None or job.status != "running":
+        return {"error": "No running refresh to cancel"}
+    job.cancel_event.set()
+    return {**job.to_dict(), "cancel_requested": True}
+
+def running_job() -> Optional[Dict[str, Any]]:
+    with _lock:
+        return _current.to_dict() if _current else None
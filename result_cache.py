@@ -0,0 +1,241 @@
+# result_cache.py
+# Small bounded LRU cache for query results, keyed on (tool, arguments, data version),
+# plus the agent's response cache: TTL + LRU in memory, optionally backed by disk or Mongo.
+import os, re, json, time, hashlib, threading, unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Hashable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Agent response cache (see open_response_cache)
+AGENT_CACHE      = os.getenv("AGENT_CACHE", "disk")          # off | memory | disk | mongo
+AGENT_CACHE_TTL  = float(os.getenv("AGENT_CACHE_TTL", "3600"))  # seconds
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "512"))    # entries per tier
+AGENT_CACHE_DIR  = os.getenv("AGENT_CACHE_DIR", ".agent_cache")
+
+_MISSING = object()
+
+def make_key(tool: str, args: dict, version: Optional[str]) -> tuple:
+    """Order-insensitive key for a tool call against a given data version."""
+    return (tool, json.dumps(args, sort_keys=True, default=str), version)
+
+def normalize_question(text: str) -> str:
+    """Case, accent, punctuation and whitespace-insensitive form of a chat question."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.sub(r"[^\w\s£.]|(?<!\d)\.|\.(?!\d)", " ", text).split())
+
+def key_id(key: Hashable) -> str:
+    """Stable string id for a cache key (file name / Mongo _id)."""
+    return hashlib.sha1(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+class LRUCache:
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = max(1, int(maxsize))
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries also expire `ttl` seconds after being set."""
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        super().__init__(maxsize)
+        self.ttl = float(ttl)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires, value = entry
+        if expires < time.time():
+            with self._lock:
+                self._data.pop(key, None)
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        super().set(key, (time.time() + self.ttl, value))
+
+class DiskStore:
+    """One JSON file per entry; file mtime is the last use, so eviction is LRU."""
+    def __init__(self, path: str = AGENT_CACHE_DIR, maxsize: int = AGENT_CACHE_SIZE):
+        self.path = path
+        self.maxsize = max(1, int(maxsize))
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, kid: str) -> str:
+        return os.path.join(self.path, f"{kid}.json")
+
+    def get(self, kid: str) -> Any:
+        fn = self._file(kid)
+        try:
+            with open(fn, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+        if entry["expires"] < time.time():
+            self._remove(fn)
+            return _MISSING
+        try:
+            os.utime(fn)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def set(self, kid: str, value: Any, ttl: float):
+        fn = self._file(kid)
+        tmp = f"{fn}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"expires": time.time() + ttl, "value": value}, f, default=str)
+        os.replace(tmp, fn)
+        files = [e for e in os.scandir(self.path) if e.name.endswith(".json")]
+        if len(files) > self.maxsize:
+            files.sort(key=lambda e: e.stat().st_mtime)
+            for e in files[:len(files) - self.maxsize]:
+                self._remove(e.path)
+
+    @staticmethod
+    def _remove(fn: str):
+        try:
+            os.remove(fn)
+        except OSError:
+            pass
+
+    def clear(self):
+        for e in os.scandir(self.path):
+            if e.name.endswith(".json"):
+                self._remove(e.path)
+
+    def __len__(self):
+        return sum(1 for e in os.scandir(self.path) if e.name.endswith(".json"))
+
+class MongoStore:
+    """Entries in a Mongo collection: a TTL index expires them, `used_at` drives LRU eviction."""
+    def __init__(self, collection, maxsize: int = AGENT_CACHE_SIZE):
+        self.coll = collection
+        self.maxsize = max(1, int(maxsize))
+        self.coll.create_index("expires_at", expireAfterSeconds=0)
+        self.coll.create_index("used_at")
+
+    def get(self, kid: str) -> Any:
+        now = datetime.now(timezone.utc)
+        doc = self.coll.find_one_and_update({"_id": kid, "expires_at": {"$gt": now}},
+                                            {"$set": {"used_at": now}}, projection={"value": 1})
+        return _MISSING if doc is None else doc["value"]
+
+    def set(self, kid: str, value: Any, ttl: float):
+        now = datetime.now(timezone.utc)
+        self.coll.replace_one({"_id": kid}, {"value": value, "used_at": now,
+                                             "expires_at": now + timedelta(seconds=ttl)}, upsert=True)
+        excess = self.coll.estimated_document_count() - self.maxsize
+        if excess > 0:
+            old = [d["_id"] for d in self.coll.find({}, {"_id": 1}).sort("used_at", 1).limit(excess)]
+            self.coll.delete_many({"_id": {"$in": old}})
+
+    def clear(self):
+        self.coll.delete_many({})
+
+    def __len__(self):
+        return self.coll.estimated_document_count()
+
+class ResponseCache:
+    """
+    Two-tier cache for agent tool results and answers: a TTL+LRU dict in front of
+    an optional shared store (DiskStore / MongoStore). Values must be JSON-able.
+    """
+    def __init__(self, maxsize: int = AGENT_CACHE_SIZE, ttl: float = AGENT_CACHE_TTL, store=None):
+        self.memory = TTLCache(maxsize, ttl)
+        self.store = store
+        self.ttl = float(ttl)
+        self.store_hits = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING and self.store is not None:
+            value = self.store.get(key_id(key))
+            if value is not _MISSING:
+                self.store_hits += 1
+                self.memory.set(key, value)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any):
+        self.memory.set(key, value)
+        if self.store is not None:
+            self.store.set(key_id(key), value, self.ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> dict:
+        out = {**self.memory.stats(), "ttl": self.ttl, "store_hits": self.store_hits,
+               "backend": type(self.store).__name__ if self.store is not None else "memory"}
+        if self.store is not None:
+            out["store_size"] = len(self.store)
+        return out
+
+class NullCache:
+    """Stand-in used when AGENT_CACHE=off."""
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "off"}
+
+def open_response_cache(backend: Optional[str] = None):
+    """ResponseCache for AGENT_CACHE (off | memory | disk | mongo)."""
+    backend = (backend or AGENT_CACHE).lower()
+    if backend == "off":
+        return NullCache()
+    if backend == "disk":
+        return ResponseCache(store=DiskStore(AGENT_CACHE_DIR, AGENT_CACHE_SIZE))
+    if backend == "mongo":
+        from mongo_conn import get_db
+        return ResponseCache(store=MongoStore(get_db().agent_cache, AGENT_CACHE_SIZE))
+    return ResponseCache()
@@ -0,0 +1,91 @@
+# similarity.py
+# "Players like X": nearest neighbours over standardized per-90, recent-form,
+# minutes-share, price and position features. KD-trees (one over everyone, one
+# per position) are built once per data version from the snapshot cache and the
+# latest player_features rows, so queries never touch Mongo.
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sklearn.neighbors import KDTree
+from features import feature_columns
+import snapshot_history
+
+# Feature weights after standardization; position is one-hot so that, when
+# positions are mixed, other positions only rank after close same-position matches.
+WEIGHTS = {"xg90": 1.0, "xa90": 1.0, "xgi90": 1.5, "minutes_share": 1.0, "price": 0.5}
+FORM_WEIGHT = 0.75
+POSITION_WEIGHT = 2.0
+
+RECORD_KEYS = ["id", "web_name", "element_type", "team", "price_m", "minutes", "xgi90", "xg90", "xa90"]
+INT_KEYS = {"id", "element_type", "team", "minutes"}
+
+class SimilarityIndex:
+    def __init__(self, cols: Dict[str, np.ndarray], form: Dict[int, Dict[str, float]], gameweeks: int):
+        # Players who haven't played have no per-90 profile to compare
+        keep = np.flatnonzero(np.nan_to_num(cols["minutes"]) > 0)
+        self.cols = cols
+        self.rows = keep
+        self.ids = cols["id"][keep].astype(int)
+        self.pos = cols["element_type"][keep].astype(int)
+        self.price = cols["price_m"][keep]
+        self.pos_of = dict(zip(self.ids.tolist(), range(len(keep))))
+
+        feats = {k: cols[k][keep] for k in ("xg90", "xa90", "xgi90")}
+        feats["minutes_share"] = np.minimum(1.0, cols["minutes"][keep] / (90.0 * max(1, gameweeks)))
+        feats["price"] = self.price
+        weights = dict(WEIGHTS)
+        for c in feature_columns():
+            feats[c] = np.array([form.get(i, {}).get(c, np.nan) for i in self.ids.tolist()], dtype=float)
+            weights[c] = FORM_WEIGHT
+
+        X = np.column_stack([feats[k] for k in weights]).astype(float)
+        mean = np.nanmean(X, axis=0) if len(X) else np.zeros(X.shape[1])
+        X = np.where(np.isnan(X), mean, X)   # no stored form -> average form
+        std = X.std(axis=0) if len(X) else np.ones(X.shape[1])
+        X = (X - mean) / np.where(std > 0, std, 1.0) * np.array(list(weights.values()))
+        onehot = (self.pos[:, None] == np.arange(1, 5)[None, :]) * (POSITION_WEIGHT / np.sqrt(2))
+        self.X = np.hstack([X, onehot])
+
+        self.trees = {None: (np.arange(len(keep)), KDTree(self.X))} if len(keep) else {}
+        for p in range(1, 5):
+            members = np.flatnonzero(self.pos == p)
+            if len(members):
+                self.trees[p] = (members, KDTree(self.X[members]))
+
+    @classmethod
+    def build(cls, db, cols: Dict[str, np.ndarray]) -> "SimilarityIndex":
+        fields = feature_columns()
+        form = {d["player_id"]: d for d in db.player_features.find(
+            {"is_latest": True}, {"_id": 0, "player_id": 1, **{f: 1 for f in fields}})}
+        events = list(db.events.find({}, {"_id": 0, "id": 1, "is_current": 1, "finished": 1}))
+        return cls(cols, form, snapshot_history.current_event(events))
+
+    def record(self, row: int) -> Dict[str, object]:
+        """JSON-friendly summary of a snapshot-cache row."""
+        out = {}
+        for k in RECORD_KEYS:
+            v = self.cols[k][row]
+            if isinstance(v, (float, np.floating)):
+                v = None if np.isnan(v) else int(v) if k in INT_KEYS else round(float(v), 2)
+            out[k] = v.item() if isinstance(v, np.generic) else v
+        return out
+
+    def similar(self, player_id: int, limit: int = 5, max_price: Optional[float] = None,
+                element_type: Optional[int] = None) -> List[Tuple[int, float]]:
+        """[(row in self.cols, distance)] of the nearest players, closest first."""
+        if player_id not in self.pos_of or element_type not in self.trees:
+            return []
+        me = self.pos_of[player_id]
+        members, tree = self.trees[element_type]
+        k = min(len(members), int(limit) * 4 + 1)
+        while True:
+            dist, idx = tree.query(self.X[me:me + 1], k=k)
+            out = []
+            for d, j in zip(dist[0], members[idx[0]]):
+                if j == me or (max_price is not None and self.price[j] > max_price):
+                    continue
+                out.append((int(self.rows[j]), float(d)))
+                if len(out) == limit:
+                    return out
+            if k == len(members):
+                return out
+            k = min(len(members), k * 4)
@@ -0,0 +1,122 @@
+# snapshot_cache.py
+# In-process, columnar copy of player_snapshots for the leaderboard tools.
+# Loaded once into NumPy arrays and reloaded when the ETL bumps the data version.
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+from mongo_conn import get_db, data_version
+
+FIELDS = {
+    # output name: source field
+    "id": "id",
+    "web_name": "web_name",
+    "element_type": "element_type",
+    "team": "team",
+    "minutes": "minutes",
+    "now_cost": "now_cost",
+    "status": "status",
+    "chance": "chance_of_playing_next_round",
+    "xgi90": "expected_goal_involvements_per_90",
+    "xg90": "expected_goals_per_90",
+    "xa90": "expected_assists_per_90",
+}
+TEXT = {"web_name", "status"}
+INTS = {"id", "element_type", "team", "minutes", "now_cost", "chance"}
+
+def _num(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _py(v, as_int: bool = False):
+    """NumPy scalar -> JSON-friendly Python value (NaN -> None)."""
+    if isinstance(v, (np.floating, float)):
+        if np.isnan(v):
+            return None
+        return int(v) if as_int else float(v)
+    if isinstance(v, np.integer):
+        return int(v)
+    return v
+
+def _top_k(scores: np.ndarray, mask: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores among mask, descending; NaN scores sort last like Mongo nulls."""
+    idx = np.flatnonzero(mask & ~np.isnan(scores))
+    if 0 < k < len(idx):
+        idx = idx[np.argpartition(-scores[idx], k - 1)[:k]]
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    if len(idx) < k:
+        idx = np.concatenate([idx, np.flatnonzero(mask & np.isnan(scores))[:k - len(idx)]])
+    return idx[:k]
+
+class SnapshotCache:
+    def __init__(self, check_interval: Optional[float] = None):
+        self.check_interval = check_interval
+        self.version = None
+        self.cols: Optional[Dict[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        return data_version() if self.check_interval is None else data_version(self.check_interval)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        v = self._current_version()
+        if self.cols is None or v != self.version:
+            with self._lock:
+                if self.cols is None or v != self.version:
+                    self.cols = self._load()
+                    self.version = v
+        return self.cols
+
+    def invalidate(self):
+        with self._lock:
+            self.cols = None
+
+    def _load(self) -> Dict[str, np.ndarray]:
+        docs = list(get_db().player_snapshots.find({}, {"_id": 0, **{f: 1 for f in FIELDS.values()}}))
+        cols = {}
+        for name, field in FIELDS.items():
+            if name in TEXT:
+                cols[name] = np.array([d.get(field) for d in docs], dtype=object)
+            else:
+                cols[name] = np.array([_num(d.get(field)) for d in docs], dtype=float)
+        cols["price_m"] = cols["now_cost"] / 10
+        return cols
+
+    def _rows(self, c, idx, keys) -> List[Dict[str, Any]]:
+        return [{k: _py(c[k][i], k in INTS) for k in keys} for i in idx]
+
+    def _mask(self, c, min_minutes, element_type):
+        mask = c["minutes"] >= int(min_minutes)
+        if element_type is not None:
+            mask &= c["element_type"] == element_type
+        return mask
+
+    def top_xgi(self, min_minutes: int = 300, element_type: Optional[int] = None, limit: int = 10):
+        c = self.columns()
+        idx = _top_k(c["xgi90"], self._mask(c, min_minutes, element_type), int(limit))
+        return self._rows(c, idx, ["id", "web_name", "element_type", "minutes", "team",
+                                   "xgi90", "xg90", "xa90", "price_m"])
+
+    def value_picks(self, min_minutes: int = 300, element_type: Optional[int] = None, limit: int = 10):
+        c = self.columns()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_m = np.where(c["price_m"] > 0, c["xgi90"] / c["price_m"], np.nan)
+        idx = _top_k(per_m, self._mask(c, min_minutes, element_type), int(limit))
+        rows = self._rows(c, idx, ["id", "web_name", "element_type", "minutes", "price_m"])
+        for r, i in zip(rows, idx):
+            r["xgi90_per_m"] = _py(per_m[i])
+        return rows
+
+    def captain_suggestion(self, min_minutes: int = 300, limit: int = 10):
+        c = self.columns()
+        # Same rule as the aggregation: unknown/zero chance counts as 90%
+        chance_f = np.where(c["chance"] > 0, c["chance"] / 100, 0.9)
+        score = c["xgi90"] * chance_f
+        idx = _top_k(score, self._mask(c, min_minutes, None), int(limit))
+        rows = self._rows(c, idx, ["id", "web_name", "element_type", "minutes",
+                                   "xgi90", "chance", "status", "price_m"])
+        for r, i in zip(rows, idx):
+            r["chanceF"] = _py(chance_f[i])
+            r["score"] = _py(score[i])
+        return rows
@@ -0,0 +1,67 @@
+# snapshot_history.py
+# Append-only price/ownership/form history of player_snapshots, stored as one
+# bucket document per (player, gameweek) that only records fields that changed.
+#
+#   {player_id, event, start: {<values when the bucket opened>},
+#    changes: [{t, <changed fields>}, ...], n, last_at}
+import datetime
+from typing import Dict, Any, List, Optional
+from pymongo import UpdateOne
+
+COLLECTION = "player_snapshot_history"
+TRACKED_FIELDS = ["now_cost", "selected_by_percent", "form", "ep_next", "status", "chance_of_playing_next_round"]
+
+def current_event(events: List[dict]) -> int:
+    """The gameweek snapshots belong to: is_current, else the last finished one (0 pre-season)."""
+    cur = [e["id"] for e in events if e.get("is_current")]
+    done = [e["id"] for e in events if e.get("finished")]
+    return (cur or [max(done, default=0)])[0]
+
+def changed_fields(prev: Optional[dict], cur: dict) -> Dict[str, Any]:
+    """Tracked fields whose value differs; a field absent from both payloads is unchanged."""
+    if prev is None:  # new player: record every tracked value
+        return {f: cur.get(f) for f in TRACKED_FIELDS}
+    return {f: cur.get(f) for f in TRACKED_FIELDS if prev.get(f) != cur.get(f)}
+
+def bucket_update(player_id: int, event: int, prev: Optional[dict], changes: Dict[str, Any],
+                  now: datetime.datetime) -> UpdateOne:
+    """Appends `changes` to the player's bucket for `event`, opening it with the previous values."""
+    start = {f: (prev or {}).get(f) for f in TRACKED_FIELDS}
+    return UpdateOne(
+        {"player_id": player_id, "event": event},
+        {"$push": {"changes": {"t": now, **changes}},
+         "$setOnInsert": {"start": start},
+         "$set": {"last_at": now},
+         "$inc": {"n": 1}},
+        upsert=True,
+    )
+
+def ensure_indexes(db):
+    db[COLLECTION].create_index([("player_id", 1), ("event", 1)], unique=True)
+
+def trajectory(db, player_id: int, last_n: int, up_to_event: int) -> List[Dict[str, Any]]:
+    """
+    End-of-gameweek values of TRACKED_FIELDS for the last `last_n` gameweeks up to
+    `up_to_event`, carrying values forward through gameweeks with no changes.
+    """
+    first = max(1, up_to_event - int(last_n) + 1)
+    coll = db[COLLECTION]
+    before = coll.find_one({"player_id": player_id, "event": {"$lt": first}}, sort=[("event", -1)])
+    buckets = {b["event"]: b for b in coll.find({"player_id": player_id, "event": {"$gte": first, "$lte": up_to_event}})}
+
+    def end_values(bucket, values):
+        values = {**values, **{k: v for k, v in (bucket.get("start") or {}).items() if k not in values or values[k] is None}}
+        for change in bucket.get("changes", []):
+            values.update({k: v for k, v in change.items() if k != "t"})
+        return values
+
+    values = end_values(before, {}) if before else {}
+    out = []
+    for event in range(first, up_to_event + 1):
+        if event in buckets:
+            values = end_values(buckets[event], values)
+            changes = len(buckets[event].get("changes", []))
+        else:
+            changes = 0
+        out.append({"event": event, **{f: values.get(f) for f in TRACKED_FIELDS}, "updates": changes})
+    return out
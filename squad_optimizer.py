@@ -0,0 +1,343 @@
+# squad_optimizer.py
+# Budget-constrained FPL squad selection: 15 players (2 GK, 5 DEF, 5 MID, 3 FWD),
+# at most 3 per club, within budget, maximising projected points.
+#
+# Each position is solved exactly with a 0/1 knapsack DP over (players, transfers,
+# cost); positions are merged with a max-plus convolution. The per-club limit is
+# enforced by best-first branch and bound: a relaxed solution that breaks it
+# branches on excluding each over-represented player. A branch is bounded by the
+# smaller of its plain DP value and a Lagrangian one (club penalties tuned once
+# at the root by subgradient steps). Incumbents come from greedy repair swaps
+# plus 1-swap local search, so a feasible squad is always returned; when the
+# time limit stops the search first it comes with optimal=False and the bound.
+import heapq, time
+from typing import Dict, Any, List, Optional, Sequence
+import numpy as np
+
+QUOTAS = {1: 2, 2: 5, 3: 5, 4: 3}
+MAX_PER_TEAM = 3
+BUDGET = 1000          # in tenths of £m, like now_cost
+TIME_LIMIT = 1.0       # seconds of branch and bound before returning the best squad found
+
+def _dominated(cost, pts, team, new, quota) -> np.ndarray:
+    """
+    Players that can never be needed: at least quota+4 distinct clubs contain a
+    same-position player that is no dearer, scores at least as much and isn't a
+    "more new" transfer. Whatever squad holds the player, one of those can be
+    swapped in without breaking any constraint (<= quota-1 of them are already
+    in the squad, <= 4 clubs can be full).
+    """
+    n = len(cost)
+    out = np.zeros(n, dtype=bool)
+    order = np.arange(n)
+    for i in range(n):
+        better = (cost <= cost[i]) & (pts >= pts[i]) & (new <= new[i]) & (
+            (pts > pts[i]) | (cost < cost[i]) | (new < new[i]) | (order < i))
+        better[i] = False
+        out[i] = len(np.unique(team[better])) >= quota + 4
+    return out
+
+def _position_dp(cost, pts, new, quota: int, T: int, C: int, cap: int):
+    """dp[k, t, c] = best points picking k players with t new ones at exact cost c <= cap."""
+    dp = np.full((quota + 1, T + 1, C + 1), -np.inf)
+    dp[0, 0, 0] = 0.0
+    take = np.zeros((len(cost), quota + 1, T + 1, C + 1), dtype=bool)
+    for i, (c, v, f) in enumerate(zip(cost, pts, new)):
+        if c > cap or f > T:
+            continue
+        cand = dp[:-1, :T + 1 - f, :cap + 1 - c] + v
+        view = dp[1:, f:, c:cap + 1]
+        better = cand > view
+        take[i, 1:, f:, c:cap + 1] = better
+        np.copyto(view, cand, where=better)
+    return dp, take
+
+def _reconstruct(take, cost, new, k: int, t: int, c: int) -> List[int]:
+    chosen = []
+    for i in range(len(cost) - 1, -1, -1):
+        if k == 0:
+            break
+        if take[i, k, t, c]:
+            chosen.append(i)
+            k, t, c = k - 1, t - new[i], c - cost[i]
+    return chosen
+
+def _frontier(a: np.ndarray):
+    """Entries of a[t, c] not beaten by one with fewer transfers and no more cost."""
+    prev = np.maximum.accumulate(np.maximum.accumulate(a, axis=1), axis=0)
+    prev = np.maximum(np.pad(prev, ((1, 0), (0, 0)), constant_values=-np.inf)[:-1],
+                      np.pad(prev, ((0, 0), (1, 0)), constant_values=-np.inf)[:, :-1])
+    return np.nonzero(np.isfinite(a) & (a > prev))
+
+def _maxplus(a: np.ndarray, b: np.ndarray):
+    """
+    out[t, c] = max over splits of a[t1, c1] + b[t - t1, c - c1], split[t, c] = (t1, c1).
+    Only frontier entries are combined, so out is exact wherever it can be optimal.
+    """
+    T, C = a.shape[0] - 1, a.shape[1] - 1
+    ta, ca = _frontier(a)
+    tb, cb = _frontier(b)
+    t = (ta[:, None] + tb[None, :]).ravel()
+    c = (ca[:, None] + cb[None, :]).ravel()
+    s = (a[ta, ca][:, None] + b[tb, cb][None, :]).ravel()
+    ia = np.repeat(np.arange(len(ta)), len(tb))
+    ok = (t <= T) & (c <= C)
+    t, c, s, ia = t[ok], c[ok], s[ok], ia[ok]
+    key = t * (C + 1) + c
+    order = np.lexsort((-s, key))
+    sel = order[np.r_[True, key[order][1:] != key[order][:-1]]]
+    out = np.full_like(a, -np.inf)
+    split = np.zeros(a.shape + (2,), dtype=int)
+    out[t[sel], c[sel]] = s[sel]
+    split[t[sel], c[sel], 0] = ta[ia[sel]]
+    split[t[sel], c[sel], 1] = ca[ia[sel]]
+    return out, split
+
+def _best_pair(a: np.ndarray, b: np.ndarray):
+    """Best a[t1, c1] + b[t2, c2] with t1 + t2 <= T and c1 + c2 <= C, via b's prefix maximum."""
+    T, C = a.shape[0] - 1, a.shape[1] - 1
+    bm = np.maximum.accumulate(np.maximum.accumulate(b, axis=1), axis=0)
+    total = a + bm[::-1, ::-1]
+    if not np.isfinite(total).any():
+        return None
+    t1, c1 = np.unravel_index(np.argmax(total), total.shape)
+    sub = b[:T + 1 - t1, :C + 1 - c1]
+    t2, c2 = np.unravel_index(np.argmax(sub), sub.shape)
+    return float(total[t1, c1]), (int(t1), int(c1)), (int(t2), int(c2))
+
+class SquadOptimizer:
+    def __init__(self, ids: Sequence[int], element_type, team, cost, points,
+                 budget: int = BUDGET, current: Optional[Sequence[int]] = None,
+                 max_transfers: Optional[int] = None):
+        self.ids = np.asarray(ids)
+        self.pos = np.asarray(element_type, dtype=int)
+        self.team = np.asarray(team, dtype=int)
+        self.cost = np.asarray(cost, dtype=int)
+        self.pts = np.asarray(points, dtype=float)
+        self.C = int(budget)
+        current = set(current or [])
+        self.new = np.array([0 if (not current or i in current) else 1 for i in self.ids], dtype=int)
+        self.T = min(15 if max_transfers is None else int(max_transfers), 15) if current else 0
+        self.has_current = bool(current)
+        # Candidate indices per position after dominance pruning
+        self.cands = {}
+        for p, quota in QUOTAS.items():
+            idx = np.flatnonzero(self.pos == p)
+            keep = ~_dominated(self.cost[idx], self.pts[idx], self.team[idx], self.new[idx], quota)
+            self.cands[p] = idx[keep]
+        # Most a position can cost while the others are still filled at their cheapest
+        floor = {p: int(np.sort(self.cost[self.pos == p])[:q].sum()) for p, q in QUOTAS.items()}
+        self.caps = {p: self.C - (sum(floor.values()) - floor[p]) for p in QUOTAS}
+        # Club penalties for the Lagrangian bound; caches are per points vector
+        self.lam = np.zeros(int(self.team.max(initial=0)) + 1)
+        self._caches = {False: ({}, {}), True: ({}, {})}
+
+    def _points(self, lagr: bool) -> np.ndarray:
+        return self.pts - self.lam[self.team] if lagr else self.pts
+
+    def _set_penalties(self, lam: np.ndarray):
+        self.lam = lam
+        self._caches[True] = ({}, {})
+
+    def _dp(self, p: int, excluded: frozenset, lagr: bool):
+        cache = self._caches[lagr][0]
+        if excluded not in cache.setdefault(p, {}):
+            idx = np.array([i for i in self.cands[p] if i not in excluded], dtype=int)
+            dp, take = _position_dp(self.cost[idx], self._points(lagr)[idx], self.new[idx],
+                                    QUOTAS[p], self.T, self.C, self.caps[p])
+            cache[p][excluded] = (idx, dp, take)
+        return cache[p][excluded]
+
+    def _pair(self, p: int, q: int, excluded: frozenset, lagr: bool):
+        cache = self._caches[lagr][1]
+        if excluded not in cache.setdefault(p, {}):
+            dp_p = self._dp(p, frozenset(i for i in excluded if self.pos[i] == p), lagr)
+            dp_q = self._dp(q, frozenset(i for i in excluded if self.pos[i] == q), lagr)
+            merged, split = _maxplus(dp_p[1][QUOTAS[p]], dp_q[1][QUOTAS[q]])
+            cache[p][excluded] = (merged, split, dp_p, dp_q)
+        return cache[p][excluded]
+
+    def _relaxed(self, excluded: frozenset, lagr: bool = False):
+        """
+        Best squad ignoring the per-club limit: (upper bound, player indices) or None.
+        With lagr the points carry the club penalties and the bound adds them back.
+        """
+        left = self._pair(1, 2, frozenset(i for i in excluded if self.pos[i] in (1, 2)), lagr)
+        right = self._pair(3, 4, frozenset(i for i in excluded if self.pos[i] in (3, 4)), lagr)
+        best = _best_pair(left[0], right[0])
+        if best is None:
+            return None
+        value, lt, rt = best
+        chosen = []
+        for (merged, split, dp_p, dp_q), (t, c), (p, q) in ((left, lt, (1, 2)), (right, rt, (3, 4))):
+            t1, c1 = split[t, c]
+            for (idx, _, take), pos, tp, cp in ((dp_p, p, t1, c1), (dp_q, q, t - t1, c - c1)):
+                chosen += [int(idx[j]) for j in _reconstruct(take, self.cost[idx], self.new[idx], QUOTAS[pos], tp, cp)]
+        if lagr:
+            value += MAX_PER_TEAM * float(self.lam.sum())
+        return value, chosen
+
+    def _over_limit(self, chosen: List[int]) -> List[int]:
+        teams, counts = np.unique(self.team[chosen], return_counts=True)
+        if not (counts > MAX_PER_TEAM).any():
+            return []
+        worst = teams[np.argmax(counts)]
+        return [i for i in chosen if self.team[i] == worst]
+
+    def _heuristic(self, excluded: frozenset, chosen: List[int]):
+        """
+        Feasible squad near a relaxed one: keep each club's 3 best picks, exclude
+        the rest and re-solve until the club limit holds, then polish by swaps.
+        """
+        while True:
+            clash = self._over_limit(chosen)
+            if not clash:
+                return self._improve(chosen)
+            clash.sort(key=lambda i: -self.pts[i])
+            excluded = excluded | set(clash[MAX_PER_TEAM:])
+            sol = self._relaxed(excluded)
+            if sol is None:
+                return self._repair(chosen)
+            chosen = sol[1]
+
+    def _swap_mask(self, chosen: List[int], out: int) -> np.ndarray:
+        """Players that can replace `out` without breaking budget, club limit or transfer cap."""
+        counts = np.bincount(self.team[chosen], minlength=len(self.lam))
+        room = counts[self.team] - (self.team == self.team[out]) < MAX_PER_TEAM
+        mask = (self.pos == self.pos[out]) & room
+        mask &= self.cost <= self.C - self.cost[chosen].sum() + self.cost[out]
+        mask &= self.new <= self.T - self.new[chosen].sum() + self.new[out]
+        mask[chosen] = False
+        return mask
+
+    def _repair(self, chosen: List[int]):
+        """Greedy cheapest-loss swaps out of over-limit clubs until the squad is feasible."""
+        chosen = list(chosen)
+        while True:
+            clash = self._over_limit(chosen)
+            if not clash:
+                return self._improve(chosen)
+            best = None
+            for out in clash:
+                mask = self._swap_mask(chosen, out) & (self.team != self.team[out])
+                if mask.any():
+                    j = int(np.flatnonzero(mask)[np.argmax(self.pts[mask])])
+                    loss = self.pts[out] - self.pts[j]
+                    if best is None or loss < best[0]:
+                        best = (loss, out, j)
+            if best is None:
+                return None
+            chosen[chosen.index(best[1])] = best[2]
+
+    def _improve(self, chosen: List[int]):
+        """Best-improvement 1-swap local search over a feasible squad."""
+        chosen = list(chosen)
+        while True:
+            best = None
+            for out in chosen:
+                mask = self._swap_mask(chosen, out) & (self.pts > self.pts[out] + 1e-9)
+                if mask.any():
+                    j = int(np.flatnonzero(mask)[np.argmax(self.pts[mask])])
+                    gain = self.pts[j] - self.pts[out]
+                    if best is None or gain > best[0]:
+                        best = (gain, out, j)
+            if best is None:
+                return float(self.pts[chosen].sum()), chosen
+            chosen[chosen.index(best[1])] = best[2]
+
+    def _current_squad(self):
+        """The current squad as a feasible solution, if it is one (all players known, fits budget)."""
+        chosen = [int(i) for i in np.flatnonzero(self.new == 0)] if self.has_current else []
+        if (len(chosen) != sum(QUOTAS.values()) or self.cost[chosen].sum() > self.C or self._over_limit(chosen)
+                or any((self.pos[chosen] == p).sum() != q for p, q in QUOTAS.items())):
+            return None
+        return self._improve(chosen)
+
+    def _subgradient(self, best, deadline: float, iters: int = 25):
+        """Tune club penalties to tighten the root bound (Polyak steps towards the incumbent)."""
+        lam, top, theta = self.lam.copy(), np.inf, 1.0
+        best_lam, stall = lam.copy(), 0
+        for _ in range(iters):
+            if time.perf_counter() > deadline:
+                break
+            self._set_penalties(lam)
+            bound, chosen = self._relaxed(frozenset(), lagr=True)
+            if self._over_limit(chosen) == []:
+                cand = (float(self.pts[chosen].sum()), chosen)
+                if best is None or cand[0] > best[0]:
+                    best = cand
+            if bound < top - 1e-9:
+                top, best_lam, stall = bound, lam.copy(), 0
+            else:
+                stall += 1
+                if stall >= 3:
+                    theta, stall = theta / 2, 0
+            g = np.bincount(self.team[chosen], minlength=len(lam)) - MAX_PER_TEAM
+            g = np.where((lam > 0) | (g > 0), g, 0).astype(float)
+            if not g.any() or best is None or top - best[0] < 1e-9:
+                break
+            lam = np.maximum(0.0, lam + theta * (bound - best[0]) / float(g @ g) * g)
+        self._set_penalties(best_lam)
+        return best
+
+    def _evaluate(self, excluded: frozenset):
+        """Node bound, an exact squad if the plain relaxation is feasible, and the clash to branch on."""
+        plain = self._relaxed(excluded)
+        if plain is None:
+            return None
+        clash = self._over_limit(plain[1])
+        if not clash:
+            return plain[0], plain, []
+        lagr = self._relaxed(excluded, lagr=True)
+        lclash = self._over_limit(lagr[1])
+        # A feasible squad from this node: the Lagrangian pick if it fits, else a repair
+        if not lclash:
+            feasible = (float(self.pts[lagr[1]].sum()), lagr[1])
+        else:
+            repairs = [r for r in (self._repair(lagr[1]), self._repair(plain[1])) if r is not None]
+            feasible = max(repairs, default=None, key=lambda r: r[0])
+        return min(plain[0], lagr[0]), feasible, lclash or clash
+
+    def solve(self, time_limit: float = TIME_LIMIT) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        root = self._relaxed(frozenset())
+        if root is None:
+            return {"error": "No squad fits the budget and position quotas."}
+        # Incumbent: the better of the exclusion heuristic and a greedy repair,
+        # else the current squad itself (always feasible with zero transfers)
+        found = [r for r in (self._heuristic(frozenset(), root[1]), self._repair(root[1]),
+                             self._current_squad()) if r is not None]
+        best = max(found, default=None, key=lambda r: r[0])
+        if self._over_limit(root[1]):
+            best = self._subgradient(best, t0 + time_limit / 3)
+        heap, seen, counter, nodes = [], {frozenset()}, 0, 0
+
+        def push(excluded):
+            nonlocal best, counter
+            ev = self._evaluate(excluded)
+            if ev is None:
+                return
+            bound, feasible, clash = ev
+            if feasible is not None and (best is None or feasible[0] > best[0]):
+                best = feasible
+            if clash and (best is None or bound > best[0] + 1e-9):
+                heapq.heappush(heap, (-bound, counter, excluded, clash))
+                counter += 1
+
+        push(frozenset())
+        # Past the time limit only while no feasible squad is known yet
+        while heap and (best is None or time.perf_counter() - t0 < time_limit):
+            if best is not None and -heap[0][0] <= best[0] + 1e-9:
+                break
+            _, _, excluded, clash = heapq.heappop(heap)
+            nodes += 1
+            for i in clash:
+                child = excluded | {i}
+                if child not in seen:
+                    seen.add(child)
+                    push(child)
+        if best is None:
+            return {"error": "No squad fits the budget, position quotas and club limit."}
+        upper = max(best[0], -heap[0][0]) if heap else best[0]
+        return {"value": best[0], "chosen": best[1], "optimal": upper <= best[0] + 1e-9,
+                "upper_bound": upper, "nodes": nodes, "seconds": round(time.perf_counter() - t0, 4)}
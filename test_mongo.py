@@ -1,14 +1,15 @@
 import os, certifi
-from pymongo import MongoClient
 from dotenv import load_dotenv
+from mongo_conn import get_client, pool_stats
 
 load_dotenv()
 uri = os.getenv("MONGO_URI")
 print("URI scheme:", uri.split("://",1)[0])   # should print mongodb+srv
 
-client = MongoClient(uri, serverSelectionTimeoutMS=20000, tlsCAFile=certifi.where())
+client = get_client(serverSelectionTimeoutMS=20000, tlsCAFile=certifi.where())
 try:
     print("Ping:", client.admin.command("ping"))
     print("✅ Connected OK")
+    print("Pool:", pool_stats())
 except Exception as e:
     print("❌ Connection failed:", e)
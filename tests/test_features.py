@@ -0,0 +1,50 @@
+# tests/test_features.py
+# build_features against the original per-player loop, and with the target
+# doubling as a rolling stat (FEATURE_EXTRA_STATS="total_points:pts,...").
+import numpy as np
+import pandas as pd
+import pytest
+from features import build_features, history_fields
+
+STATS = {"expected_goal_involvements": "xgi", "minutes": "mins"}
+
+def history(seed: int = 0, players: int = 30, rounds: int = 12) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = [{"player_id": pid, "round": r, "minutes": int(rng.integers(0, 91)),
+             "expected_goal_involvements": float(rng.random()), "total_points": int(rng.integers(0, 15)),
+             "bps": int(rng.integers(0, 40))}
+            for pid in range(1, players + 1) for r in rng.permutation(np.arange(1, rng.integers(2, rounds) + 1))]
+    return pd.DataFrame(rows)
+
+def nested_loop(hist: pd.DataFrame) -> pd.DataFrame:
+    """The pre-vectorisation training rows: trailing 4-round means, next round's points."""
+    rows = []
+    for pid, h in hist.groupby("player_id"):
+        h = h.sort_values("round").to_dict("records")
+        for i in range(len(h) - 1):
+            prev4 = h[max(0, i - 3):i + 1]
+            rows.append({"player_id": pid, "round": h[i]["round"],
+                         "xgi_l4": np.mean([r["expected_goal_involvements"] for r in prev4]),
+                         "mins_l4": np.mean([r["minutes"] for r in prev4]),
+                         "points_next": h[i + 1]["total_points"]})
+    return pd.DataFrame(rows)
+
+def test_matches_nested_loop():
+    hist = history()
+    new = build_features(hist, windows=(4,), stats=STATS)
+    old = nested_loop(hist)
+    cols = ["player_id", "round", "xgi_l4", "mins_l4", "points_next"]
+    pd.testing.assert_frame_equal(new[cols].astype(float), old[cols].astype(float))
+
+def test_target_as_rolling_stat():
+    stats = {**STATS, "total_points": "pts", "bps": "bps"}
+    assert history_fields(stats) == ["player_id", "round", "total_points",
+                                     "expected_goal_involvements", "minutes", "bps"]
+    hist = history(1)
+    feats = build_features(hist, windows=(2,), stats=stats, with_target=False)
+    h = hist.sort_values(["player_id", "round"])
+    g = h.groupby("player_id")
+    expected = g["total_points"].rolling(2, min_periods=1).mean().to_numpy()
+    assert feats["pts_l2"].to_numpy() == pytest.approx(expected)
+    assert feats["points_next"].to_numpy() == pytest.approx(g["total_points"].shift(-1).to_numpy(), nan_ok=True)
+    assert "total_points" not in feats.columns
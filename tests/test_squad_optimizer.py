@@ -0,0 +1,71 @@
+# tests/test_squad_optimizer.py
+# SquadOptimizer against an exact MILP (scipy) on seeded random player pools,
+# including pools where one or two strong clubs make the club limit bind.
+import numpy as np
+import pytest
+from squad_optimizer import SquadOptimizer, QUOTAS, MAX_PER_TEAM
+
+optimize = pytest.importorskip("scipy.optimize")
+
+def pool(seed: int, strong_clubs: int, n: int = 400):
+    rng = np.random.default_rng(seed)
+    pos = rng.choice([1, 2, 3, 4], n, p=[.1, .33, .4, .17])
+    team = rng.integers(1, 21, n)
+    strength = rng.normal(0, 1, 21)
+    strength[rng.choice(np.arange(1, 21), strong_clubs, replace=False)] += 2.5
+    cost = rng.integers(40, 130, n)
+    pts = np.round(cost / 25 + strength[team] * 1.2 + rng.normal(0, 1, n), 2)
+    return pos, team, cost, pts
+
+def milp_optimum(pos, team, cost, pts, budget, current=None, max_transfers=None):
+    rows, lo, hi = [], [], []
+    for p, q in QUOTAS.items():
+        rows.append(pos == p); lo.append(q); hi.append(q)
+    for t in np.unique(team):
+        rows.append(team == t); lo.append(0); hi.append(MAX_PER_TEAM)
+    rows.append(cost); lo.append(0); hi.append(budget)
+    if current is not None:
+        rows.append(~np.isin(np.arange(len(pos)), current)); lo.append(0); hi.append(max_transfers)
+    res = optimize.milp(-pts, integrality=np.ones(len(pos)), bounds=optimize.Bounds(0, 1),
+                        constraints=optimize.LinearConstraint(np.array(rows, dtype=float), lo, hi))
+    assert res.success
+    return -res.fun
+
+def check(result, pos, team, cost, pts, budget, optimum, current=None, max_transfers=None):
+    assert "error" not in result
+    chosen = result["chosen"]
+    assert len(set(chosen)) == 15
+    assert all((pos[chosen] == p).sum() == q for p, q in QUOTAS.items())
+    assert np.bincount(team[chosen]).max() <= MAX_PER_TEAM
+    assert cost[chosen].sum() <= budget
+    if current is not None:
+        assert len(set(chosen) - set(current)) <= max_transfers
+    assert result["value"] == pytest.approx(pts[chosen].sum())
+    assert result["value"] <= optimum + 1e-6 <= result["upper_bound"] + 2e-6
+    if result["optimal"]:
+        assert result["value"] == pytest.approx(optimum)
+    assert optimum - result["value"] <= 0.01 * optimum  # near-optimal even when not proven
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("strong_clubs", [1, 2])
+def test_matches_milp(seed, strong_clubs):
+    pos, team, cost, pts = pool(seed, strong_clubs)
+    result = SquadOptimizer(np.arange(len(pos)), pos, team, cost, pts, budget=1000).solve()
+    check(result, pos, team, cost, pts, 1000, milp_optimum(pos, team, cost, pts, 1000))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_transfers_match_milp(seed):
+    pos, team, cost, pts = pool(seed, 1)
+    # A feasible current squad: the best pick under a tighter budget
+    current = SquadOptimizer(np.arange(len(pos)), pos, team, cost, pts, budget=850).solve()["chosen"]
+    budget = int(cost[current].sum()) + 5
+    result = SquadOptimizer(np.arange(len(pos)), pos, team, cost, pts, budget=budget,
+                            current=current, max_transfers=2).solve()
+    optimum = milp_optimum(pos, team, cost, pts, budget, current, 2)
+    check(result, pos, team, cost, pts, budget, optimum, current, 2)
+
+def test_tight_budget_still_returns_a_squad():
+    pos, team, cost, pts = pool(0, 2)
+    budget = int(sum(np.sort(cost[pos == p])[:q].sum() for p, q in QUOTAS.items())) + 60
+    result = SquadOptimizer(np.arange(len(pos)), pos, team, cost, pts, budget=budget).solve()
+    check(result, pos, team, cost, pts, budget, milp_optimum(pos, team, cost, pts, budget))
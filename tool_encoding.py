@@ -0,0 +1,116 @@
+# tool_encoding.py
+# Compact, token-budgeted text encoding of tool results for the agent's prompt.
+#
+# Lists of records become one header line plus one comma-separated line per row
+# (keys aren't repeated, floats are rounded, element_type/team ids become
+# GK/DEF/MID/FWD and club short names). Anything over the token budget is cut
+# from the end of each table, so the same result always encodes the same way.
+import os, json, math
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOOL_TOKENS  = int(os.getenv("AGENT_TOOL_TOKENS", "1200"))  # budget for all results of one turn
+FLOAT_DIGITS = int(os.getenv("AGENT_FLOAT_DIGITS", "2"))
+MIN_TOKENS   = 80                                            # floor per result when the budget is split
+
+POSITIONS = {1: "GK", 2: "DEF", 3: "MID", 4: "FWD"}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) - no tokenizer dependency."""
+    return math.ceil(len(text) / 4)
+
+def _cell(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, float):
+        if not math.isfinite(v):
+            return ""
+        s = f"{v:.{FLOAT_DIGITS}f}".rstrip("0").rstrip(".")
+        return "0" if s in ("", "-0") else s
+    if isinstance(v, list) and not any(isinstance(x, (list, dict)) for x in v):
+        v = ";".join(_cell(x) for x in v)
+    elif isinstance(v, (list, dict)):
+        v = json.dumps(v, separators=(",", ":"), ensure_ascii=False, default=str)
+    s = str(v)
+    return f'"{s}"' if ("," in s or "\n" in s) else s
+
+def _labelled(row: Dict[str, Any], teams: Dict[int, str]) -> Dict[str, Any]:
+    out = {}
+    for k, v in row.items():
+        if k == "element_type":
+            out["pos"] = POSITIONS.get(v, v)
+        elif k == "team" and isinstance(v, int) and teams:
+            out["team"] = teams.get(v, v)
+        elif isinstance(v, dict) and all(not isinstance(x, (dict, list)) for x in v.values()):
+            out.update({f"{k}.{sk}": sv for sk, sv in v.items()})
+        else:
+            out[k] = v
+    return out
+
+def _table(rows: List[Dict[str, Any]], teams: Dict[int, str]) -> List[str]:
+    rows = [_labelled(r, teams) for r in rows]
+    cols = list(dict.fromkeys(k for r in rows for k in r))
+    return [",".join(cols)] + [",".join(_cell(r.get(c)) for c in cols) for r in rows]
+
+def _is_table(v: Any) -> bool:
+    return isinstance(v, list) and bool(v) and all(isinstance(r, dict) for r in v)
+
+def _blocks(result: Any, teams: Dict[int, str], name: Optional[str] = None) -> List[tuple]:
+    """[(label, header_lines, row_lines)] - only row_lines are ever truncated."""
+    if _is_table(result):
+        header, *rows = _table(result, teams)
+        return [(name, [header], rows)]
+    if isinstance(result, dict):
+        scalars = {k: v for k, v in result.items() if not _is_table(v)}
+        blocks = []
+        if scalars:
+            blocks.append((name, [f"{k}: {_cell(v)}" for k, v in _labelled(scalars, teams).items()], []))
+        for k, v in result.items():
+            if _is_table(v):
+                blocks += _blocks(v, teams, f"{name}.{k}" if name else k)
+        return blocks
+    return [(name, [_cell(result)], [])]
+
+def _render(blocks: List[tuple], cap: Optional[int]) -> str:
+    lines = []
+    for label, header, rows in blocks:
+        if label and rows:
+            lines.append(f"{label}:")
+        lines += header
+        kept = rows if cap is None else rows[:cap]
+        lines += kept
+        if len(kept) < len(rows):
+            lines.append(f"… {len(rows) - len(kept)} more rows")
+    return "\n".join(lines)
+
+def encode_result(result: Any, budget: int = TOOL_TOKENS, teams: Optional[Dict[int, str]] = None) -> str:
+    """
+    Columnar text for a tool result within `budget` tokens (estimated). Rows are
+    dropped from the end of every table alike until it fits; headers, scalars
+    and errors are always kept.
+    """
+    blocks = _blocks(result, teams or {})
+    text = _render(blocks, None)
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, max((len(rows) for _, _, rows in blocks), default=0)
+    while lo < hi:   # largest per-table row cap that fits
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(_render(blocks, mid)) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return _render(blocks, lo)
+
+def share(n_results: int, budget: int = TOOL_TOKENS) -> int:
+    """Per-result budget when one turn's budget is split evenly between its tool calls."""
+    return max(MIN_TOKENS, budget // max(1, n_results))
+
+def encode_results(results: List[Any], budget: int = TOOL_TOKENS,
+                   teams: Optional[Dict[int, str]] = None) -> List[str]:
+    """Encodes all results of one turn within a shared budget."""
+    return [encode_result(r, share(len(results), budget), teams) for r in results]